@@ -0,0 +1,207 @@
+"""API HTTP local com os agregados do histórico
+
+Roda em uma thread do próprio processo do Streamlit (tornado) e serve o cubo
+semana x nutricionista e os KPIs a partir do histórico local (historico.py), e
+não do último upload de alguma sessão: o que BI e as planilhas recebem só muda
+quando um processamento é gravado no histórico. As respostas levam um ETag
+derivado da versão do histórico, então clientes que fazem polling recebem 304
+sem que nada seja consultado ou serializado.
+
+Ativada pela variável de ambiente FLUA_API_PORTA (endereço em FLUA_API_ENDERECO,
+padrão 127.0.0.1).
+
+    GET /api/periodos
+    GET /api/cubo?periodo=2025-11&formato=json|arrow
+    GET /api/kpis?periodo=2025-11
+
+No Railway só a porta $PORT (a do Streamlit) é roteada publicamente. Para as
+ferramentas internas, defina nas variáveis do serviço FLUA_API_PORTA (ex.: 8502)
+e FLUA_API_ENDERECO=:: (a rede privada do Railway é IPv6); outros serviços do
+mesmo projeto acessam http://<serviço>.railway.internal:8502/api/... Clientes
+fora do Railway precisam de um TCP Proxy apontando para essa porta.
+"""
+import asyncio
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import tornado.web
+from tornado.ioloop import IOLoop
+
+import historico
+
+MAX_RESPOSTAS = 64
+
+
+class CacheRespostas:
+    """Corpos serializados por (versão do histórico, recurso, período, formato)"""
+
+    def __init__(self, max_respostas=MAX_RESPOSTAS):
+        self._lock = threading.Lock()
+        self._respostas = OrderedDict()
+        self._max = max_respostas
+
+    def obter(self, chave, gerar):
+        with self._lock:
+            if chave in self._respostas:
+                self._respostas.move_to_end(chave)
+                return self._respostas[chave]
+        corpo = gerar()
+        with self._lock:
+            self._respostas[chave] = corpo
+            while len(self._respostas) > self._max:
+                self._respostas.popitem(last=False)
+        return corpo
+
+
+respostas = CacheRespostas()
+
+
+def calcular_kpis(cubo):
+    """KPIs do período: totais e taxa de ocupação, geral e por semana"""
+    oferta = int(cubo["oferta"].sum())
+    ocupacao = int(cubo["ocupacao"].sum())
+    semanas = (
+        cubo.groupby(["ano", "mes", "semana", "semana_label"], sort=True)[["oferta", "ocupacao"]]
+        .sum().reset_index()
+    )
+    return {
+        "oferta_total": oferta,
+        "ocupacao_total": ocupacao,
+        "taxa_ocupacao": round(ocupacao / oferta * 100, 1) if oferta > 0 else 0,
+        "semanas": semanas.to_dict(orient="records"),
+    }
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def compute_etag(self):
+        # O ETag é definido a partir da versão do histórico antes de gerar o corpo
+        return None
+
+    def _versao(self):
+        versao = historico.versao()
+        if versao == 0:
+            raise tornado.web.HTTPError(404, reason="Nenhum dado gravado no histórico")
+        return versao
+
+    def _periodo(self):
+        periodo = self.get_query_argument("periodo", "")
+        if periodo:
+            partes = periodo.split("-")
+            if len(partes) != 2 or not all(p.isdigit() for p in partes) or not 1 <= int(partes[1]) <= 12:
+                raise tornado.web.HTTPError(400, reason="periodo deve estar no formato AAAA-MM")
+        return periodo
+
+    def _cubo(self, periodo):
+        return historico.consultar_cubo(tuple(int(p) for p in periodo.split("-")) if periodo else None)
+
+    def _responder(self, chave, gerar, content_type):
+        self.set_header("Etag", f'"{"-".join(str(c) for c in chave)}"')
+        self.set_header("Cache-Control", "no-cache")
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        self.set_header("Content-Type", content_type)
+        self.write(respostas.obter(chave, gerar))
+
+    def write_error(self, status_code, **kwargs):
+        self.finish({"erro": self._reason})
+
+
+class PeriodosHandler(BaseHandler):
+    def get(self):
+        versao = self._versao()
+        self._responder(
+            (versao, "periodos"),
+            lambda: json.dumps({
+                "versao": versao,
+                "periodos": [f"{a}-{m:02d}" for a, m in historico.listar_periodos()],
+            }),
+            "application/json; charset=utf-8",
+        )
+
+
+class CuboHandler(BaseHandler):
+    def get(self):
+        versao = self._versao()
+        periodo = self._periodo()
+        formato = self.get_query_argument("formato", "json")
+        if formato not in ("json", "arrow"):
+            raise tornado.web.HTTPError(400, reason="formato deve ser json ou arrow")
+
+        def gerar():
+            df = self._cubo(periodo)
+            if formato == "arrow":
+                import pyarrow as pa
+
+                tabela = pa.Table.from_pandas(df, preserve_index=False)
+                buffer = io.BytesIO()
+                with pa.ipc.new_stream(buffer, tabela.schema) as writer:
+                    writer.write_table(tabela)
+                return buffer.getvalue()
+            return json.dumps({
+                "versao": versao,
+                "periodo": periodo or "todos",
+                "cubo": df.to_dict(orient="records"),
+            }, ensure_ascii=False)
+
+        self._responder(
+            (versao, "cubo", periodo or "todos", formato),
+            gerar,
+            "application/vnd.apache.arrow.stream" if formato == "arrow" else "application/json; charset=utf-8",
+        )
+
+
+class KpisHandler(BaseHandler):
+    def get(self):
+        versao = self._versao()
+        periodo = self._periodo()
+        self._responder(
+            (versao, "kpis", periodo or "todos"),
+            lambda: json.dumps(
+                {"versao": versao, "periodo": periodo or "todos", **calcular_kpis(self._cubo(periodo))},
+                ensure_ascii=False,
+            ),
+            "application/json; charset=utf-8",
+        )
+
+
+def criar_app():
+    return tornado.web.Application([
+        (r"/api/periodos", PeriodosHandler),
+        (r"/api/cubo", CuboHandler),
+        (r"/api/kpis", KpisHandler),
+    ])
+
+
+def iniciar_servidor(porta, endereco=None):
+    """Sobe a API em uma thread daemon com seu próprio event loop"""
+    endereco = endereco or os.environ.get("FLUA_API_ENDERECO", "127.0.0.1")
+    pronto = threading.Event()
+    erro = []
+
+    def _executar():
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        try:
+            criar_app().listen(porta, address=endereco)
+        except Exception as e:
+            erro.append(e)
+            pronto.set()
+            return
+        pronto.set()
+        IOLoop.current().start()
+
+    thread = threading.Thread(target=_executar, name="flua-api", daemon=True)
+    thread.start()
+    pronto.wait(10)
+    if erro:
+        raise erro[0]
+    return thread
+
+
+def porta_configurada():
+    """Porta da API definida em FLUA_API_PORTA, ou None se desativada"""
+    porta = os.environ.get("FLUA_API_PORTA")
+    return int(porta) if porta else None
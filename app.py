@@ -5,8 +5,19 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 import io
+import logging
+import os
+import hashlib
+import zipfile
 from PIL import Image
 
+import api
+import historico
+import ingestor
+import relatorios
+
+logger = logging.getLogger(__name__)
+
 # Configuração da página
 logo_icon = Image.open("images/flua-logo.png")
 st.set_page_config(
@@ -142,6 +153,9 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Funções auxiliares do ETL
+mes_abrev = {1:"Jan",2:"Fev",3:"Mar",4:"Abr",5:"Mai",6:"Jun",
+             7:"Jul",8:"Ago",9:"Set",10:"Out",11:"Nov",12:"Dez"}
+
 def label_semana(df):
     """Adiciona rótulos de semana ao DataFrame"""
     s = df["Data"]
@@ -156,9 +170,6 @@ def label_semana(df):
     week_start = week_mon.where(week_mon >= m_ini, m_ini)
     week_end = week_sun.where(week_sun <= m_fim, m_fim)
 
-    mes_abrev = {1:"Jan",2:"Fev",3:"Mar",4:"Abr",5:"Mai",6:"Jun",
-                7:"Jul",8:"Ago",9:"Set",10:"Out",11:"Nov",12:"Dez"}
-
     w0 = m_ini.dt.weekday
     week_in_month = ((s.dt.day + w0 - 1) // 7 + 1).astype("Int64")
 
@@ -167,19 +178,53 @@ def label_semana(df):
         s[mask].dt.month.astype(str)
         + " " +
         s[mask].dt.month.map(mes_abrev)
+        + "/" + (s[mask].dt.year % 100).astype(str).str.zfill(2)
         + " - Sem " + week_in_month[mask].astype(str)
         + " - " + week_start[mask].dt.day.astype(str).str.zfill(2)
         + " a " + week_end[mask].dt.day.astype(str).str.zfill(2)
     )
 
+    # Chaves inteiras de período: AAAAMM para o mês e AAAAMMS para a semana do mês
+    periodo = (s.dt.year * 100 + s.dt.month).astype("Int64")
+
     df["Semana_mes"] = week_in_month
     df["Semana_label"] = label
     df["Mes_num"] = s.dt.month
     df["Mes_nome"] = s.dt.month.map(mes_abrev)
+    df["Periodo"] = periodo
+    df["Semana_cod"] = periodo * 10 + week_in_month
     return df
 
+def levantar_rejeitos(df_original, defeitos, nutri, arquivo):
+    """Consolida as máscaras de defeito em uma tabela de rejeitos (uma linha por registro x defeito)
+
+    Recebe máscaras booleanas já calculadas sobre as colunas convertidas, então
+    o custo é o de uma operação de coluna a mais. Retorna a tabela e a máscara
+    das linhas que devem sair do processamento.
+    """
+    motivos = np.array(list(defeitos.keys()))
+    matriz = np.column_stack([np.asarray(m, dtype=bool) for m in defeitos.values()])
+    linhas, classes = np.nonzero(matriz)
+
+    rejeitos = df_original.iloc[linhas].reset_index(drop=True)
+    rejeitos.insert(0, "Arquivo", arquivo)
+    rejeitos.insert(1, "Linha", linhas + 2)  # +2: cabeçalho e numeração a partir de 1, como no Excel
+    rejeitos.insert(2, "Motivo", motivos[classes])
+    rejeitos.insert(3, "Nutricionista", nutri.iloc[linhas].replace("", pd.NA).fillna("(vazio)").to_numpy())
+    return rejeitos, matriz.any(axis=1)
+
+def resumo_qualidade(rejeitos):
+    """Contagem de defeitos por arquivo e motivo"""
+    if len(rejeitos) == 0:
+        return pd.DataFrame(columns=["Arquivo", "Motivo", "Registros"])
+    return (
+        rejeitos.groupby(["Arquivo", "Motivo"]).size()
+        .rename("Registros").reset_index()
+        .sort_values(["Arquivo", "Registros"], ascending=[True, False])
+    )
+
 def processar_disponibilidade(df):
-    """Processa dados de disponibilidade"""
+    """Processa dados de disponibilidade; retorna os dados válidos e os rejeitos"""
     dict_mes = {1:'Janeiro', 2:'Fevereiro', 3:'Março', 4:'Abril', 5:'Maio', 6:'Junho',
                 7:'Julho', 8:'Agosto', 9:'Setembro', 10:'Outubro', 11:'Novembro', 12:'Dezembro'}
     
@@ -196,13 +241,31 @@ def processar_disponibilidade(df):
     df_trd["Início"] = pd.to_datetime(df_trd["Início"], format="%H:%M:%S", errors="coerce")
     df_trd['Fim'] = df['HORAS TOTAIS'].copy()
     df_trd["Fim"] = pd.to_datetime(df_trd["Fim"], format="%H:%M:%S", errors="coerce")
+    df_trd["Janelas"] = (df_trd["Fim"] - df_trd["Início"]).dt.total_seconds() / 3600
+    df_trd['Nutri'] = df['Unnamed: 6'].copy()
+    
+    # Verificação de qualidade: registros com defeito saem do processamento e vão para o arquivo de rejeitos
+    nutri_arquivo = df_trd['Nutri'].astype("string").str.strip()
+    rejeitos, rejeitado = levantar_rejeitos(
+        df,
+        {
+            "Data inválida ou vazia": df_trd["Data"].isna(),
+            "Horário inicial inválido": df_trd["Início"].isna(),
+            "Horário final inválido": df_trd["Fim"].isna(),
+            "Janela negativa (Fim < Início)": df_trd["Janelas"] < 0,
+            "Nutricionista vazia": nutri_arquivo.fillna("") == "",
+        },
+        nutri_arquivo,
+        "Disponibilidade"
+    )
+    df_trd = df_trd[~rejeitado].copy()
+    
     df_trd["Total horas"] = (df_trd["Fim"] - df_trd["Início"])
     df_trd["Total horas"] = df_trd["Total horas"].apply(lambda x: str(x).split(" days ")[-1] if pd.notnull(x) else None)
-    df_trd["Janelas"] = (df_trd["Fim"] - df_trd["Início"]).dt.total_seconds() / 3600
     df_trd["Janelas"] = df_trd["Janelas"].astype(int)
+    df_trd["Hora_inicio"] = (df_trd["Início"] - df_trd["Início"].dt.normalize()).dt.total_seconds() / 3600
     df_trd["Início"] = df_trd["Início"].dt.time
     df_trd["Fim"] = df_trd["Fim"].dt.time
-    df_trd['Nutri'] = df['Unnamed: 6'].copy()
     df_trd.drop(columns=['Mês_num'], inplace=True)
     
     # Implementar nomenclatura reduzida conforme solicitado
@@ -213,15 +276,45 @@ def processar_disponibilidade(df):
         .apply(lambda x: f"{x[0]} {x[-1][0]}." if len(x) > 1 else x[0])
     )
     
-    return label_semana(df_trd)
+    return label_semana(df_trd), rejeitos
+
+def extrair_hora_agenda(df):
+    """Hora do agendamento (fração de horas) a partir da coluna de horário ou da própria data"""
+    for col in ['HORA', 'HORÁRIO', 'HORARIO', 'HORA INICIAL', 'INÍCIO']:
+        if col in df.columns:
+            texto = df[col].astype("string").str.strip()
+            break
+    else:
+        # Formato "dd/mm/aaaa - HH:MM" na coluna de data
+        texto = df["Data completa"].astype("string").str.split(" - ").str[-1].str.strip()
+    hora = pd.to_datetime(texto, format="%H:%M:%S", errors="coerce")
+    hora = hora.fillna(pd.to_datetime(texto, format="%H:%M", errors="coerce"))
+    return (hora - hora.dt.normalize()).dt.total_seconds() / 3600
 
 def processar_ocupacao(df):
-    """Processa dados de ocupação"""
+    """Processa dados de ocupação; retorna os dados válidos e os rejeitos"""
     df_trd = df.copy()
     df_trd.rename(columns={'DATA':'Data completa', 'RESPONSÁVEL':'Nutri'}, inplace=True)
     df_trd["Data"] = df_trd["Data completa"].str.split(" -").str[0]
     df_trd["Data"] = pd.to_datetime(df_trd["Data"], format="%d/%m/%Y", errors="coerce")
     
+    df_trd["Hora"] = extrair_hora_agenda(df_trd)
+    
+    # Verificação de qualidade: agendas sem data, responsável ou caso não entram nos totais
+    nutri_arquivo = df_trd["Nutri"].astype("string").str.strip()
+    caso = df_trd["CASO"].astype("string").str.strip() if "CASO" in df_trd.columns else pd.Series(pd.NA, index=df_trd.index, dtype="string")
+    rejeitos, rejeitado = levantar_rejeitos(
+        df,
+        {
+            "Data inválida ou vazia": df_trd["Data"].isna(),
+            "Responsável vazio": nutri_arquivo.fillna("") == "",
+            "Caso vazio": caso.fillna("") == "",
+        },
+        nutri_arquivo,
+        "Agenda"
+    )
+    df_trd = df_trd[~rejeitado].copy()
+    
     # Aplicar nomenclatura reduzida também na ocupação
     df_trd["Nutri"] = (
         df_trd["Nutri"]
@@ -230,7 +323,259 @@ def processar_ocupacao(df):
         .apply(lambda x: f"{x[0]} {x[-1][0]}." if len(x) > 1 else x[0])
     )
     
-    return label_semana(df_trd)
+    return label_semana(df_trd), rejeitos
+
+def indexar_por_nutri(df):
+    """Calcula uma vez as posições das linhas de cada nutricionista"""
+    return df.groupby("Nutri", sort=True).indices
+
+def fatiar_nutri(df, indices, nutri, periodo=None):
+    """Retorna apenas as linhas de uma nutricionista a partir dos índices pré-calculados"""
+    posicoes = indices.get(nutri)
+    if posicoes is None:
+        return df.iloc[0:0]
+    df_nutri = df.iloc[posicoes]
+    if periodo is not None:
+        df_nutri = df_nutri[df_nutri['Periodo'] == periodo]
+    return df_nutri
+
+def grade_oferta_horaria(dia_semana, hora_inicio, janelas, grupo=None, n_grupos=1):
+    """Expande cada janela em slots de 1h e conta por dia da semana x hora (7 x 24)
+
+    Vetorizado: np.repeat replica cada janela pelo número de horas, um offset
+    0..n-1 dentro de cada janela dá a hora de cada slot e um único bincount
+    sobre dia*24+hora monta a grade. Com ``grupo`` (códigos 0..n_grupos-1, ex.:
+    nutricionista) retorna uma grade por grupo, shape (n_grupos, 7, 24).
+    """
+    valido = ~(np.isnan(dia_semana) | np.isnan(hora_inicio) | np.isnan(janelas))
+    if grupo is not None:
+        valido &= grupo >= 0
+    dia = dia_semana[valido].astype(np.int64)
+    hora = np.floor(hora_inicio[valido]).astype(np.int64)
+    n = np.clip(janelas[valido], 0, 24).astype(np.int64)
+    base = grupo[valido].astype(np.int64) * (7 * 24) if grupo is not None else np.zeros(n.size, dtype=np.int64)
+
+    linha = np.repeat(np.arange(n.size), n)
+    offset = np.arange(linha.size) - np.repeat(np.cumsum(n) - n, n)
+    hora_slot = hora[linha] + offset
+    dentro = hora_slot < 24
+    celula = base[linha][dentro] + dia[linha][dentro] * 24 + hora_slot[dentro]
+    grade = np.bincount(celula, minlength=n_grupos * 7 * 24)
+    return grade.reshape(n_grupos, 7, 24) if grupo is not None else grade.reshape(7, 24)
+
+def grade_agendas_horaria(dia_semana, hora, grupo=None, n_grupos=1):
+    """Conta agendamentos por dia da semana x hora (7 x 24), opcionalmente por grupo"""
+    valido = ~(np.isnan(dia_semana) | np.isnan(hora))
+    if grupo is not None:
+        valido &= grupo >= 0
+    base = grupo[valido].astype(np.int64) * (7 * 24) if grupo is not None else 0
+    celula = base + dia_semana[valido].astype(np.int64) * 24 + np.floor(hora[valido]).astype(np.int64) % 24
+    grade = np.bincount(celula, minlength=n_grupos * 7 * 24)
+    return grade.reshape(n_grupos, 7, 24) if grupo is not None else grade.reshape(7, 24)
+
+def recomendar_ajustes(oferta, agendas, n_semanas, meta=80.0, tolerancia=5.0, max_alteracoes=5):
+    """Propõe o menor conjunto de horários semanais a remover ou adicionar por nutricionista
+
+    ``oferta`` e ``agendas`` são grades (nutricionistas, 7, 24) do histórico.
+    Guloso e vetorizado para toda a equipe de uma vez:
+    - ocupação abaixo da meta: remove os horários ofertados de menor ocupação
+      histórica (no empate, os mais ofertados) até a projeção alcançar a meta
+      (somas acumuladas + argmax), sem passar de ``max_alteracoes`` horas
+      semanais ofertadas;
+    - ocupação acima da meta: adiciona os horários não ofertados pela pessoa
+      com maior ocupação na equipe, na quantidade que traz a taxa para a meta.
+    Retorna as máscaras (remover, adicionar) e a taxa projetada por pessoa.
+    """
+    n_nutris = oferta.shape[0]
+    o = oferta.reshape(n_nutris, -1) / n_semanas
+    b = agendas.reshape(n_nutris, -1) / n_semanas
+    oferta_total = o.sum(axis=1)
+    agendas_total = b.sum(axis=1)
+    alvo = meta / 100.0
+    tol = tolerancia / 100.0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        taxa = np.where(oferta_total > 0, agendas_total / oferta_total, np.nan)
+
+        # Remoções: horários ofertados em ordem crescente de ocupação; no empate (ex.:
+        # horários sem nenhuma agenda) vem primeiro o que tem mais horas ofertadas
+        taxa_celula = np.where(o > 0, b / o, np.inf)
+        ordem = np.lexsort((-o, taxa_celula), axis=1)
+        o_ord = np.take_along_axis(o, ordem, axis=1)
+        cum_o = np.cumsum(o_ord, axis=1)
+        cum_b = np.cumsum(np.take_along_axis(b, ordem, axis=1), axis=1)
+        restante = oferta_total[:, None] - cum_o
+        projecao_rem = np.where(restante > 1e-9, (agendas_total[:, None] - cum_b) / restante, np.nan)
+    atinge = (projecao_rem >= alvo - tol) & (o_ord > 0)
+    n_ofertados = (o > 0).sum(axis=1)
+    k_rem = np.where(atinge.any(axis=1), atinge.argmax(axis=1) + 1, n_ofertados)
+    # O limite conta horas semanais ofertadas (0,25 para um horário ofertado em 1 de 4
+    # semanas), não células da grade
+    cabem = (cum_o <= max_alteracoes + 1e-9).sum(axis=1)
+    k_rem = np.where(taxa < alvo - tol, np.minimum(k_rem, cabem), 0)
+
+    remover = np.zeros_like(o, dtype=bool)
+    np.put_along_axis(remover, ordem, np.arange(o.shape[1])[None, :] < k_rem[:, None], axis=1)
+
+    # Adições: horários em que a equipe atende, ainda não ofertados pela pessoa
+    with np.errstate(divide="ignore", invalid="ignore"):
+        demanda = np.where(o.sum(axis=0) > 0, b.sum(axis=0) / o.sum(axis=0), -np.inf)
+        k_add = np.ceil(np.where(taxa > alvo + tol, agendas_total / alvo - oferta_total, 0))
+    k_add = np.clip(np.nan_to_num(k_add), 0, max_alteracoes).astype(np.int64)
+    pontuacao = np.where(o > 0, -np.inf, demanda[None, :])
+    ordem_add = np.argsort(-pontuacao, axis=1, kind="stable")
+    candidato = np.isfinite(np.take_along_axis(pontuacao, ordem_add, axis=1))
+    escolhido = candidato & (np.arange(o.shape[1])[None, :] < k_add[:, None])
+    adicionar = np.zeros_like(o, dtype=bool)
+    np.put_along_axis(adicionar, ordem_add, escolhido, axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        oferta_proj = oferta_total - (o * remover).sum(axis=1) + adicionar.sum(axis=1)
+        agendas_proj = agendas_total - (b * remover).sum(axis=1)
+        taxa_proj = np.where(oferta_proj > 0, agendas_proj / oferta_proj, np.nan)
+
+    return (
+        remover.reshape(oferta.shape),
+        adicionar.reshape(oferta.shape),
+        taxa * 100,
+        taxa_proj * 100,
+    )
+
+def inicio_semana(datas):
+    """Segunda-feira da semana de cada data (chave de semana do calendário)"""
+    return (datas - pd.to_timedelta(datas.dt.weekday, unit="D")).dt.normalize()
+
+def matrizes_semanais(df_disp, df_ocup, semana_disp, semana_ocup, semanas=None):
+    """Matrizes semana x nutricionista de oferta e ocupação
+
+    As semanas vêm de uma coluna ou de um array alinhado a cada DataFrame; se
+    ``semanas`` for dado, as linhas seguem exatamente esse índice (faltantes zeradas).
+    """
+    oferta = df_disp.pivot_table(index=semana_disp, columns='Nutri', values='Janelas', aggfunc='sum', fill_value=0)
+    ocupacao = df_ocup.pivot_table(index=semana_ocup, columns='Nutri', values='CASO', aggfunc='count', fill_value=0)
+    if semanas is None:
+        semanas = oferta.index.union(ocupacao.index)
+    nutris = oferta.columns.union(ocupacao.columns)
+    oferta = oferta.reindex(index=semanas, columns=nutris, fill_value=0)
+    ocupacao = ocupacao.reindex(index=semanas, columns=nutris, fill_value=0)
+    return semanas.to_numpy(), nutris.to_numpy(), oferta.to_numpy(dtype=float), ocupacao.to_numpy(dtype=float)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cubo_semanal(chave_dataset, _df_disp, _df_ocup):
+    """Matrizes semana do calendário x nutricionista, sem lacunas
+
+    Cada linha é uma semana de segunda a domingo (não as semanas do mês, que são
+    cortadas na virada do mês) e semanas sem dados entram zeradas, então N linhas
+    consecutivas cobrem exatamente N semanas.
+    """
+    semana_disp = inicio_semana(_df_disp['Data'])
+    semana_ocup = inicio_semana(_df_ocup['Data'])
+    limites = pd.concat([semana_disp, semana_ocup]).agg(['min', 'max'])
+    semanas = pd.date_range(limites['min'], limites['max'], freq='7D')
+    return matrizes_semanais(_df_disp, _df_ocup, semana_disp, semana_ocup, semanas)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cubo_semanas_mes(chave_dataset, _df_disp, _df_ocup):
+    """Matrizes semana do mês (Semana_cod) x nutricionista, como nas tabelas do período"""
+    return matrizes_semanais(_df_disp, _df_ocup, 'Semana_cod', 'Semana_cod')
+
+def somas_acumuladas(matriz):
+    """Soma acumulada por coluna com uma linha de zeros no início
+
+    A soma de qualquer janela de semanas [i, j] é cs[j + 1] - cs[i]. Para
+    acrescentar uma semana basta empilhar cs[-1] + nova_semana, O(nutricionistas).
+    """
+    return np.vstack([np.zeros((1, matriz.shape[1])), np.cumsum(matriz, axis=0)])
+
+def taxa_movel(cs_oferta, cs_ocupacao, janela, fim):
+    """Taxa de ocupação (%) das `janela` semanas terminando no índice `fim`, por nutricionista
+
+    Cada chamada é O(nutricionistas); sem histórico suficiente retorna NaN.
+    """
+    ini = fim + 1 - janela
+    if ini < 0:
+        return np.full(cs_oferta.shape[1], np.nan)
+    oferta = cs_oferta[fim + 1] - cs_oferta[ini]
+    ocupacao = cs_ocupacao[fim + 1] - cs_ocupacao[ini]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(oferta > 0, ocupacao / oferta * 100, np.nan)
+
+def hash_dataset(df_disp, df_ocup):
+    """Identificador do conteúdo dos dados processados, usado como chave de cache"""
+    h = hashlib.sha1()
+    for df in (df_disp, df_ocup):
+        h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def gerar_exportacao(chave_dataset, periodo, nome, _tabela):
+    """Serializa uma tabela em CSV no padrão do Excel brasileiro (; e UTF-8 com BOM), sob demanda"""
+    csv = _tabela.to_csv(index=True, sep=";", decimal=",")
+    return ("\ufeff" + csv).encode('utf-8')
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def gerar_zip_exportacoes(chave_dataset, periodo, _tabelas):
+    """Agrupa as tabelas em um ZIP com os mesmos CSVs dos downloads individuais"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for nome, df in _tabelas.items():
+            zf.writestr(f"{nome}.csv", gerar_exportacao(chave_dataset, periodo, nome, df))
+    return buffer.getvalue()
+
+def tarefas_relatorios(semanas, nutris, oferta, ocupacao, labels_semana, periodo, formato):
+    """Uma tarefa por nutricionista com as séries semanais do período selecionado
+
+    Só listas pequenas de números vão para os processos; nada de DataFrames.
+    """
+    mascara = np.isin(semanas, labels_semana.index)
+    rotulos = labels_semana.reindex(semanas[mascara]).tolist()
+    oferta, ocupacao = oferta[mascara], ocupacao[mascara]
+    ativas = (oferta.sum(axis=0) + ocupacao.sum(axis=0)) > 0
+    return [
+        (nutri, periodo, rotulos, oferta[:, j].tolist(), ocupacao[:, j].tolist(), formato)
+        for j, nutri in enumerate(nutris) if ativas[j]
+    ]
+
+def processar_arquivos(df_disp_bruto, df_ocup_bruto):
+    """Processamento completo dos dois arquivos, sem dependência da interface
+
+    Usado pela Seção 2 e pelo ingestor em segundo plano. Tenta gravar os
+    agregados diários no histórico local, que é também a fonte da API.
+    """
+    df_disp_proc, rejeitos_disp = processar_disponibilidade(df_disp_bruto)
+    df_ocup_proc, rejeitos_ocup = processar_ocupacao(df_ocup_bruto)
+    dataset_hash = hash_dataset(df_disp_proc, df_ocup_proc)
+
+    # Gravar os agregados diários no histórico local
+    dias = historico.agregar_dias(df_disp_proc, df_ocup_proc)
+    try:
+        periodos_gravados = historico.gravar_agregados(dias)
+        erro_historico = None
+    except Exception as e:
+        periodos_gravados = []
+        erro_historico = str(e)
+
+    return {
+        "disponibilidade_data": df_disp_bruto,
+        "ocupacao_data": df_ocup_bruto,
+        "processed_disponibilidade": df_disp_proc,
+        "processed_ocupacao": df_ocup_proc,
+        "rejeitos": pd.concat([rejeitos_disp, rejeitos_ocup], ignore_index=True),
+        # Índices por nutricionista para o detalhamento individual
+        "indices_disponibilidade": indexar_por_nutri(df_disp_proc),
+        "indices_ocupacao": indexar_por_nutri(df_ocup_proc),
+        "dataset_hash": dataset_hash,
+        "periodos_gravados": periodos_gravados,
+        "erro_historico": erro_historico,
+    }
+
+def carregar_resultado(resultado):
+    """Copia um resultado de processar_arquivos para o estado da sessão"""
+    for chave in [
+        "disponibilidade_data", "ocupacao_data", "processed_disponibilidade", "processed_ocupacao",
+        "rejeitos", "indices_disponibilidade", "indices_ocupacao", "dataset_hash"
+    ]:
+        st.session_state[chave] = resultado[chave]
 
 def formatar_numero(num):
     """Formata números com separador de milhar"""
@@ -251,6 +596,226 @@ def formatar_percentual(valor):
     """Formata percentuais com vírgula como separador decimal"""
     return f"{valor:.1f}%".replace(".", ",")
 
+def simular_cenarios(oferta_total, ocupacao_total, custos, impostos, valores, taxas_ocupacao=None):
+    """Avalia meta, faturamento e lucro para toda a grade custo x imposto x valor x ocupação
+
+    Os parâmetros são vetores; o resultado é um dicionário de arrays com
+    shape (custos, impostos, valores, taxas). Sem ``taxas_ocupacao`` usa a
+    ocupação realizada no período como único cenário de ocupação.
+    """
+    custo = np.asarray(custos, dtype=float)[:, None, None, None]
+    imposto = np.asarray(impostos, dtype=float)[None, :, None, None] / 100.0
+    valor = np.asarray(valores, dtype=float)[None, None, :, None]
+
+    if taxas_ocupacao is None or len(taxas_ocupacao) == 0:
+        agendas = np.array([ocupacao_total], dtype=float)
+        taxas = agendas / oferta_total * 100 if oferta_total > 0 else np.zeros(1)
+    else:
+        taxas = np.asarray(taxas_ocupacao, dtype=float)
+        agendas = np.floor(oferta_total * taxas / 100.0)
+    agendas = agendas[None, None, None, :]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Mesma fórmula da meta do dashboard; cenários sem solução ficam NaN
+        meta = np.where(
+            (imposto < 1.0) & (valor > 0),
+            np.ceil((custo / (1 - imposto)) / valor),
+            np.nan
+        )
+        ocupacao_equilibrio = meta / oferta_total * 100 if oferta_total > 0 else np.full_like(meta, np.nan)
+
+    faturamento = agendas * valor
+    lucro = faturamento * (1 - imposto) - custo
+    shape = np.broadcast_shapes(meta.shape, lucro.shape)
+
+    return {
+        "custo": np.broadcast_to(custo, shape),
+        "imposto": np.broadcast_to(imposto * 100, shape),
+        "valor": np.broadcast_to(valor, shape),
+        "taxa": np.broadcast_to(taxas[None, None, None, :], shape),
+        "agendas": np.broadcast_to(agendas, shape),
+        "meta": np.broadcast_to(meta, shape),
+        "ocupacao_equilibrio": np.broadcast_to(ocupacao_equilibrio, shape),
+        "faturamento": np.broadcast_to(faturamento, shape),
+        "lucro": lucro,
+    }
+
+def tabela_cenarios(cenarios):
+    """Achata a grade de cenários em uma tabela, uma linha por combinação"""
+    return pd.DataFrame({
+        "Custo (R$/mês)": cenarios["custo"].ravel(),
+        "Impostos (%)": cenarios["imposto"].ravel(),
+        "Valor Consulta (R$)": cenarios["valor"].ravel(),
+        "% Ocupação": cenarios["taxa"].ravel(),
+        "Agendamentos": cenarios["agendas"].ravel(),
+        "Meta Agendamentos": cenarios["meta"].ravel(),
+        "% Ocupação p/ Meta": cenarios["ocupacao_equilibrio"].ravel(),
+        "Faturamento": cenarios["faturamento"].ravel(),
+        "Lucro": cenarios["lucro"].ravel(),
+    })
+
+@st.fragment
+def exibir_recomendacoes(nutris, oferta_grade, agendas_grade, n_semanas):
+    """Sugestões de ajuste de agenda; reexecuta apenas este bloco ao mudar os parâmetros"""
+    col1, col2 = st.columns(2)
+    with col1:
+        max_alteracoes = st.number_input(
+            "Máximo de horas semanais alteradas por nutricionista",
+            min_value=1,
+            max_value=40,
+            value=5,
+            help="Horas semanais adicionadas ou removidas por pessoa; uma remoção conta as horas "
+                 "efetivamente ofertadas no horário (ofertado em 1 de 4 semanas = 0,25h)"
+        )
+    with col2:
+        tolerancia = st.slider(
+            "Tolerância em torno da meta de 80% (p.p.)",
+            min_value=0.0,
+            max_value=20.0,
+            value=5.0,
+            step=0.5
+        )
+
+    remover, adicionar, taxa_atual, taxa_proj = recomendar_ajustes(
+        oferta_grade, agendas_grade, n_semanas,
+        meta=80.0, tolerancia=tolerancia, max_alteracoes=int(max_alteracoes)
+    )
+
+    n_remover = remover.reshape(len(nutris), -1).sum(axis=1)
+    n_adicionar = adicionar.reshape(len(nutris), -1).sum(axis=1)
+    com_ajuste = (n_remover + n_adicionar) > 0
+    if not com_ajuste.any():
+        st.markdown('<div class="success-box">✅ Todas as nutricionistas estão dentro da faixa da meta</div>', unsafe_allow_html=True)
+        return
+
+    st.dataframe(
+        pd.DataFrame({
+            "Nutricionista": nutris,
+            "Ocupação Atual (%)": taxa_atual.round(1),
+            "Ocupação Projetada (%)": taxa_proj.round(1),
+            "Horários a Remover": n_remover,
+            "Horas a Remover (h/sem)": (oferta_grade * remover).reshape(len(nutris), -1).sum(axis=1) / n_semanas,
+            "Horários a Adicionar": n_adicionar,
+        })[com_ajuste],
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Ocupação Atual (%)": st.column_config.NumberColumn(format="%.1f%%"),
+            "Ocupação Projetada (%)": st.column_config.NumberColumn(format="%.1f%%"),
+            "Horas a Remover (h/sem)": st.column_config.NumberColumn(format="%.2f"),
+        }
+    )
+
+    dias_semana = np.array(["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        taxa_horario = np.where(oferta_grade > 0, agendas_grade / oferta_grade * 100, np.nan)
+        taxa_equipe = agendas_grade.sum(axis=0) / oferta_grade.sum(axis=0) * 100
+    detalhes = []
+    for mascara, acao in [(remover, "Remover"), (adicionar, "Adicionar")]:
+        n, d, h = np.nonzero(mascara)
+        detalhes.append(pd.DataFrame({
+            "Nutricionista": nutris[n],
+            "Ação": acao,
+            "Dia": pd.Categorical(dias_semana[d], categories=dias_semana, ordered=True),
+            "Horário": [f"{x:02d}h" for x in h],
+            "Ocupação do Horário (%)": np.where(acao == "Remover", taxa_horario[n, d, h], taxa_equipe[d, h]).round(1),
+            "Oferta Média (h/sem)": (oferta_grade[n, d, h] / n_semanas).round(2),
+        }))
+    with st.expander("📋 Ver horários sugeridos"):
+        st.caption("Para adições, a ocupação é a da equipe naquele horário.")
+        st.dataframe(
+            pd.concat(detalhes, ignore_index=True).sort_values(["Nutricionista", "Ação", "Dia", "Horário"]),
+            use_container_width=True,
+            hide_index=True
+        )
+
+@st.fragment
+def exibir_simulador_cenarios(oferta_total, ocupacao_total):
+    """Simulador de cenários financeiros; reexecuta apenas este bloco"""
+    custo_base = float(st.session_state.custo_nutri_mes) or 30000.0
+    valor_base = float(st.session_state.valor_consulta) or 100.0
+
+    with st.form("form_cenarios"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            custo_min = st.number_input("Custo mínimo (R$/mês)", min_value=0.0, value=custo_base * 0.5, step=1000.0)
+            custo_max = st.number_input("Custo máximo (R$/mês)", min_value=0.0, value=custo_base * 1.5, step=1000.0)
+            custo_passos = st.number_input("Passos de custo", min_value=1, max_value=200, value=21)
+        with col2:
+            valor_min = st.number_input("Valor mínimo (R$)", min_value=0.0, value=valor_base * 0.5, step=5.0)
+            valor_max = st.number_input("Valor máximo (R$)", min_value=0.0, value=valor_base * 1.5, step=5.0)
+            valor_passos = st.number_input("Passos de valor", min_value=1, max_value=200, value=21)
+        with col3:
+            imposto_atual = float(st.session_state.impostos)
+            impostos_cenario = st.multiselect(
+                "Impostos (%)",
+                sorted({0.0, 6.0, 10.0, 15.0, 20.0, imposto_atual}),
+                default=sorted({imposto_atual, 15.0})
+            )
+            taxas_cenario = st.multiselect(
+                "Taxas de ocupação alvo (%)",
+                [50, 60, 70, 75, 80, 85, 90, 95, 100],
+                help="Deixe vazio para usar a ocupação realizada no período"
+            )
+        st.form_submit_button("🧮 Calcular Cenários", type="primary")
+
+    if not impostos_cenario:
+        st.warning("⚠️ Selecione ao menos um percentual de impostos")
+        return
+
+    custos = np.linspace(custo_min, max(custo_min, custo_max), int(custo_passos))
+    valores = np.linspace(valor_min, max(valor_min, valor_max), int(valor_passos))
+    impostos = np.array(sorted(impostos_cenario))
+    cenarios = simular_cenarios(oferta_total, ocupacao_total, custos, impostos, valores, taxas_cenario)
+
+    st.caption(f"{cenarios['lucro'].size:,} cenários avaliados".replace(",", "."))
+
+    # Superfície de equilíbrio: % da oferta que precisa ser ocupada para cobrir o custo
+    i_imp = 0
+    if len(impostos) > 1:
+        imposto_superficie = st.select_slider(
+            "Impostos na superfície de equilíbrio (%)",
+            options=list(impostos),
+            key="imposto_superficie"
+        )
+        i_imp = int(np.searchsorted(impostos, imposto_superficie))
+    fig_equilibrio = go.Figure(go.Heatmap(
+        x=valores,
+        y=custos,
+        z=cenarios["ocupacao_equilibrio"][:, i_imp, :, 0],
+        colorscale=[[0, '#c3d76b'], [0.8, '#fcc105'], [1, '#eb4524']],
+        zmin=0,
+        zmax=100,
+        colorbar=dict(title="% Ocupação"),
+        hovertemplate="Valor: R$ %{x:.2f}<br>Custo: R$ %{y:,.0f}<br>Ocupação p/ meta: %{z:.1f}%<extra></extra>"
+    ))
+    fig_equilibrio.update_layout(
+        title='Ocupação Necessária para o Ponto de Equilíbrio',
+        xaxis_title='Valor por Consulta (R$)',
+        yaxis_title='Custo com Nutricionistas (R$/mês)',
+        height=450
+    )
+    st.plotly_chart(fig_equilibrio, use_container_width=True)
+
+    df_cenarios = tabela_cenarios(cenarios).sort_values("Lucro", ascending=False)
+    st.dataframe(
+        df_cenarios,
+        use_container_width=True,
+        height=400,
+        hide_index=True,
+        column_config={
+            "Custo (R$/mês)": st.column_config.NumberColumn(format="R$ %.2f"),
+            "Valor Consulta (R$)": st.column_config.NumberColumn(format="R$ %.2f"),
+            "Impostos (%)": st.column_config.NumberColumn(format="%.2f%%"),
+            "% Ocupação": st.column_config.NumberColumn(format="%.1f%%"),
+            "Agendamentos": st.column_config.NumberColumn(format="%d"),
+            "Meta Agendamentos": st.column_config.NumberColumn(format="%d"),
+            "% Ocupação p/ Meta": st.column_config.NumberColumn(format="%.1f%%"),
+            "Faturamento": st.column_config.NumberColumn(format="R$ %.2f"),
+            "Lucro": st.column_config.NumberColumn(format="R$ %.2f"),
+        }
+    )
+
 # Inicializar session state
 if 'current_step' not in st.session_state:
     st.session_state.current_step = 1
@@ -268,9 +833,61 @@ if 'impostos' not in st.session_state:
     st.session_state.impostos = 0
 if 'valor_consulta' not in st.session_state:
     st.session_state.valor_consulta = 0
+if 'indices_disponibilidade' not in st.session_state:
+    st.session_state.indices_disponibilidade = None
+if 'indices_ocupacao' not in st.session_state:
+    st.session_state.indices_ocupacao = None
+if 'rejeitos' not in st.session_state:
+    st.session_state.rejeitos = None
+if 'dataset_hash' not in st.session_state:
+    st.session_state.dataset_hash = None
+if 'exportacao_preparada' not in st.session_state:
+    st.session_state.exportacao_preparada = None
+if 'relatorios_individuais' not in st.session_state:
+    st.session_state.relatorios_individuais = None
 if 'mes_selecionado' not in st.session_state:
     st.session_state.mes_selecionado = None
 
+# API local com os agregados do histórico (opcional, via FLUA_API_PORTA)
+@st.cache_resource(show_spinner=False)
+def iniciar_api():
+    """Sobe a API uma única vez por processo"""
+    porta = api.porta_configurada()
+    if porta is None:
+        return None
+    try:
+        return api.iniciar_servidor(porta)
+    except OSError as e:
+        logger.warning("API local não iniciada na porta %s: %s", porta, e)
+        return None
+
+iniciar_api()
+
+# Ingestão da pasta compartilhada em segundo plano (opcional, via FLUA_PASTA_INGESTAO)
+@st.cache_resource(show_spinner=False)
+def iniciar_ingestor():
+    """Sobe o monitoramento da pasta uma única vez por processo"""
+    config = ingestor.configuracao()
+    if config is None:
+        return None
+    return ingestor.Ingestor(
+        config["pasta"],
+        processar_arquivos,
+        debounce=config["debounce"],
+        max_workers=config["max_workers"]
+    ).iniciar()
+
+monitor_pasta = iniciar_ingestor()
+if 'origem_ingestor' not in st.session_state:
+    st.session_state.origem_ingestor = None
+
+# Sessões sem dados próprios abrem direto nos resultados já processados da pasta
+resultado_pasta = monitor_pasta.ultimo_resultado if monitor_pasta is not None else None
+if resultado_pasta is not None and st.session_state.processed_disponibilidade is None:
+    carregar_resultado(resultado_pasta)
+    st.session_state.origem_ingestor = resultado_pasta["dataset_hash"]
+    st.session_state.current_step = 3
+
 # Título principal com logo
 try:
     col_logo, col_title = st.columns([1, 9])
@@ -448,15 +1065,19 @@ elif st.session_state.current_step == 2:
         if st.button("🚀 Iniciar Processamento", type="primary", use_container_width=True):
             with st.spinner("⏳ Processando dados..."):
                 try:
-                    # Processar disponibilidade
-                    df_disp_proc = processar_disponibilidade(st.session_state.disponibilidade_data)
-                    st.session_state.processed_disponibilidade = df_disp_proc
-                    
-                    # Processar ocupação
-                    df_ocup_proc = processar_ocupacao(st.session_state.ocupacao_data)
-                    st.session_state.processed_ocupacao = df_ocup_proc
+                    resultado = processar_arquivos(
+                        st.session_state.disponibilidade_data,
+                        st.session_state.ocupacao_data
+                    )
+                    carregar_resultado(resultado)
+                    st.session_state.origem_ingestor = None
                     
                     st.success("✅ Dados processados com sucesso!")
+                    
+                    if resultado["erro_historico"] is None:
+                        st.info(f"🗄️ {len(resultado['periodos_gravados'])} período(s) gravado(s) no histórico")
+                    else:
+                        st.warning(f"⚠️ Não foi possível gravar o histórico: {resultado['erro_historico']}")
                         
                 except Exception as e:
                     st.error(f"❌ Erro no processamento: {str(e)}")
@@ -476,6 +1097,61 @@ elif st.session_state.current_step == 2:
                 st.subheader("📊 Ocupação Processada")
                 st.dataframe(st.session_state.processed_ocupacao.head(), use_container_width=True)
             
+            # Qualidade dos dados
+            st.markdown("---")
+            st.subheader("🧪 Qualidade dos Dados")
+            
+            rejeitos = st.session_state.rejeitos
+            if rejeitos is None or len(rejeitos) == 0:
+                st.markdown('<div class="success-box">✅ Nenhum registro com defeito encontrado</div>', unsafe_allow_html=True)
+            else:
+                lidos = {
+                    "Disponibilidade": len(st.session_state.disponibilidade_data),
+                    "Agenda": len(st.session_state.ocupacao_data)
+                }
+                col1, col2 = st.columns(2)
+                for col, arquivo in zip([col1, col2], ["Disponibilidade", "Agenda"]):
+                    with col:
+                        n_rejeitados = rejeitos.loc[rejeitos["Arquivo"] == arquivo, "Linha"].nunique()
+                        st.metric(
+                            f"Registros descartados - {arquivo}",
+                            formatar_numero(n_rejeitados),
+                            delta=f"{formatar_percentual(n_rejeitados / lidos[arquivo] * 100 if lidos[arquivo] else 0)} do arquivo",
+                            delta_color="inverse" if n_rejeitados > 0 else "off",
+                            help=f"{formatar_numero(lidos[arquivo])} registros lidos"
+                        )
+                
+                st.markdown('<div class="warning-box">⚠️ Os registros abaixo não entram nos totais do dashboard</div>', unsafe_allow_html=True)
+                st.dataframe(resumo_qualidade(rejeitos), use_container_width=True, hide_index=True)
+                
+                with st.expander("👥 Defeitos por nutricionista"):
+                    st.dataframe(
+                        rejeitos.pivot_table(
+                            index=["Arquivo", "Nutricionista"],
+                            columns="Motivo",
+                            values="Linha",
+                            aggfunc="count",
+                            fill_value=0
+                        ).reset_index(),
+                        use_container_width=True,
+                        hide_index=True
+                    )
+                
+                with st.expander("🔍 Amostra dos registros com defeito"):
+                    st.dataframe(
+                        rejeitos.groupby(["Arquivo", "Motivo"], sort=False).head(5),
+                        use_container_width=True,
+                        hide_index=True
+                    )
+                
+                st.download_button(
+                    label="📥 Download Registros Rejeitados (CSV)",
+                    data=("\ufeff" + rejeitos.to_csv(index=False, sep=";")).encode('utf-8'),
+                    file_name=f"rejeitos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                    mime="text/csv",
+                    on_click="ignore"
+                )
+            
             st.markdown("---")
             if st.button("➡️ Avançar para Resultados", type="primary", use_container_width=True):
                 st.session_state.current_step = 3
@@ -490,6 +1166,20 @@ elif st.session_state.current_step == 2:
 elif st.session_state.current_step == 3:
     st.markdown('<div class="section-header">📊 Seção 3: Dashboard de Disponibilidade</div>', unsafe_allow_html=True)
     
+    # Dados vindos da pasta monitorada
+    if resultado_pasta is not None and st.session_state.origem_ingestor is not None:
+        st.caption(
+            f"📂 Pasta monitorada: {' + '.join(resultado_pasta['arquivos'])} "
+            f"(processados em {resultado_pasta['gerado_em'].strftime('%d/%m/%Y %H:%M')})"
+        )
+        if resultado_pasta["dataset_hash"] != st.session_state.origem_ingestor:
+            if st.button("🔄 Carregar dados mais recentes da pasta"):
+                carregar_resultado(resultado_pasta)
+                st.session_state.origem_ingestor = resultado_pasta["dataset_hash"]
+                st.rerun()
+    if monitor_pasta is not None and monitor_pasta.ultimo_erro is not None:
+        st.warning(f"⚠️ Falha ao processar arquivos da pasta monitorada: {monitor_pasta.ultimo_erro}")
+    
     if st.session_state.processed_disponibilidade is None or st.session_state.processed_ocupacao is None:
         st.warning("⚠️ Dados não processados. Por favor, complete as etapas anteriores.")
         if st.button("⬅️ Voltar para Processamento"):
@@ -499,32 +1189,43 @@ elif st.session_state.current_step == 3:
         df_disp = st.session_state.processed_disponibilidade
         df_ocup = st.session_state.processed_ocupacao
         
-        # Filtro de mês (se houver mais de 1 mês nos dados)
-        meses_disponiveis = sorted(df_disp['Mes_num'].dropna().unique())
-        if len(meses_disponiveis) > 1:
-            meses_nomes = df_disp.groupby('Mes_num')['Mes_nome'].first().to_dict()
-            opcoes_meses = ["Todos os meses"] + [f"{meses_nomes[m]} ({m})" for m in meses_disponiveis]
+        periodo_num = None
+        
+        # Filtro de mês/ano (se houver mais de 1 mês nos dados)
+        periodos_disponiveis = sorted(df_disp['Periodo'].dropna().unique())
+        nomes_periodos = {
+            p: f"{mes_abrev[p % 100]}/{p // 100}"
+            for p in periodos_disponiveis
+        }
+        if len(periodos_disponiveis) > 1:
+            opcoes_meses = ["Todos os meses"] + [nomes_periodos[p] for p in periodos_disponiveis]
             
             mes_selecionado = st.selectbox(
                 "🗓️ Selecione o período:",
                 opcoes_meses,
                 key="filtro_mes",
-                help="Filtre os dados por mês específico ou visualize todos os meses disponíveis"
+                help="Filtre os dados por mês/ano específico ou visualize todos os meses disponíveis"
             )
             
             if mes_selecionado != "Todos os meses":
-                mes_num = int(mes_selecionado.split("(")[1].split(")")[0])
-                df_disp = df_disp[df_disp['Mes_num'] == mes_num]
-                df_ocup = df_ocup[df_ocup['Mes_num'] == mes_num]
-                periodo_label = mes_selecionado.split(" (")[0]
+                periodo_num = periodos_disponiveis[opcoes_meses.index(mes_selecionado) - 1]
+                df_disp = df_disp[df_disp['Periodo'] == periodo_num]
+                df_ocup = df_ocup[df_ocup['Periodo'] == periodo_num]
+                periodo_label = mes_selecionado
             else:
                 periodo_label = "Todos os meses"
         else:
-            periodo_label = df_disp['Mes_nome'].iloc[0] if len(df_disp) > 0 else "Mês atual"
+            periodo_label = nomes_periodos[periodos_disponiveis[0]] if len(periodos_disponiveis) > 0 else "Mês atual"
+        
+        # Rótulos de exibição de cada semana; agrupamento e ordenação usam o código inteiro
+        labels_semana = pd.concat([
+            df_disp[['Semana_cod', 'Semana_label']],
+            df_ocup[['Semana_cod', 'Semana_label']]
+        ]).dropna().drop_duplicates('Semana_cod').set_index('Semana_cod')['Semana_label']
         
         # Criar tabela consolidada
         df_output = df_disp.pivot_table(
-            index='Semana_label',
+            index='Semana_cod',
             columns='Nutri',
             values='Janelas',
             aggfunc='sum',
@@ -535,7 +1236,7 @@ elif st.session_state.current_step == 3:
         df_output['CHECK'] = 'Oferta'
         
         tb_temp = df_ocup.pivot_table(
-            index='Semana_label',
+            index='Semana_cod',
             columns='Nutri',
             values='CASO',
             aggfunc='count',
@@ -557,13 +1258,13 @@ elif st.session_state.current_step == 3:
         df_output = df_output[new_order]
         df_output = df_output.fillna(0)
         df_output[middle_cols_sorted + col_total] = df_output[middle_cols_sorted + col_total].astype(int)
-        df_output = df_output.sort_index()
+        df_output = df_output.sort_index(kind="stable")
         
         # KPIs principais - TAMANHO AUMENTADO
         st.subheader("📈 KPIs Principais")
         
         df_semana = df_output.pivot_table(
-            index="Semana_label",
+            index="Semana_cod",
             columns="CHECK",
             values="TOTAL",
             aggfunc="sum",
@@ -669,31 +1370,20 @@ elif st.session_state.current_step == 3:
                     delta_color="normal",
                     help=help_meta
                 )
-        
+
+        # SIMULADOR DE CENÁRIOS - grade de custos, impostos e valores sobre os totais já calculados
+        st.markdown("---")
+        st.subheader("🧮 Simulador de Cenários Financeiros")
+        with st.expander("Explorar cenários de custo, impostos, valor e ocupação"):
+            exibir_simulador_cenarios(float(oferta_total), float(ocupacao_total))
+
         # TABELA DETALHADA - com linhas alternadas branco/cinza
         st.markdown("---")
         st.subheader(f"📋 Tabela Detalhada - {periodo_label}")
         
-        # Ordenar df_output cronologicamente antes de exibir
-        import re
-        def extract_sort_key(label):
-            if not isinstance(label, str):
-                return (0, 0)
-            match = re.search(r'^(\d+)\s+\w+\s+-\s+Sem\s+(\d+)', label)
-            if match:
-                mes = int(match.group(1))
-                semana = int(match.group(2))
-                return (mes, semana)
-            return (0, 0)
-        
-        # Criar chave de ordenação
-        sort_keys = {idx: extract_sort_key(idx) for idx in df_output.index}
-        df_output['_sort_key'] = df_output.index.map(sort_keys)
-        df_output = df_output.sort_values('_sort_key')
-        df_output = df_output.drop(columns=['_sort_key'])
-        
         # Estilizar tabela com linhas alternadas
         df_output_display = df_output.copy()
+        df_output_display.index = df_output_display.index.map(labels_semana)
         df_output_display.index.name = "Semana"
         df_output_display = df_output_display.rename(columns={'CHECK': 'Tipo'})
         
@@ -723,23 +1413,6 @@ elif st.session_state.current_step == 3:
         st.markdown("---")
         st.subheader(f"📅 Resumo por Semana - {periodo_label}")
         
-        # Ordenar cronologicamente
-        import re
-        def extract_sort_key(label):
-            if not isinstance(label, str):
-                return (0, 0)
-            match = re.search(r'^(\d+)\s+\w+\s+-\s+Sem\s+(\d+)', label)
-            if match:
-                mes = int(match.group(1))
-                semana = int(match.group(2))
-                return (mes, semana)
-            return (0, 0)
-        
-        sort_keys = {idx: extract_sort_key(idx) for idx in df_semana.index}
-        df_semana['_sort_key'] = df_semana.index.map(sort_keys)
-        df_semana = df_semana.sort_values('_sort_key')
-        df_semana = df_semana.drop(columns=['_sort_key'])
-        
         df_semana_display = df_semana.copy()
         df_semana_display["% de Ocupação"] = (
             df_semana_display["Ocupação"] / df_semana_display["Oferta"]
@@ -757,8 +1430,9 @@ elif st.session_state.current_step == 3:
         df_semana_display = df_semana_display[["Oferta", "Ocupação", "% de Ocupação", "% Horários Vagos"]]
         
         # Reset index para aplicar estilo
+        df_semana_display.index = df_semana_display.index.map(labels_semana)
         df_semana_display = df_semana_display.reset_index()
-        df_semana_display = df_semana_display.rename(columns={'Semana_label': 'Semana'})
+        df_semana_display = df_semana_display.rename(columns={'Semana_cod': 'Semana'})
         
         # Aplicar cores alternadas
         def apply_row_colors(row):
@@ -781,7 +1455,7 @@ elif st.session_state.current_step == 3:
         
         # Recalcular para valores numéricos
         df_semana_numeric = df_output.pivot_table(
-            index="Semana_label",
+            index="Semana_cod",
             columns="CHECK",
             values="TOTAL",
             aggfunc="sum",
@@ -792,29 +1466,8 @@ elif st.session_state.current_step == 3:
             if col not in df_semana_numeric.columns:
                 df_semana_numeric[col] = 0
         
-        # Criar chave de ordenação baseada no mês (número) e semana
-        # Formato: "11 Nov - Sem 1 - 01 a 02"
-        import re
-        def extract_sort_key(label):
-            if not isinstance(label, str):
-                return (0, 0)
-            match = re.search(r'^(\d+)\s+\w+\s+-\s+Sem\s+(\d+)', label)
-            if match:
-                mes = int(match.group(1))
-                semana = int(match.group(2))
-                return (mes, semana)
-            return (0, 0)
-        
-        # Criar coluna temporária para ordenação
-        sort_keys = [extract_sort_key(idx) for idx in df_semana_numeric.index]
-        df_semana_numeric['_sort_mes'] = [k[0] for k in sort_keys]
-        df_semana_numeric['_sort_sem'] = [k[1] for k in sort_keys]
-        
-        # Ordenar por mês e semana
-        df_semana_numeric = df_semana_numeric.sort_values(['_sort_mes', '_sort_sem'])
-        
-        # Remover colunas auxiliares
-        df_semana_numeric = df_semana_numeric.drop(columns=['_sort_mes', '_sort_sem'])
+        # Índice inteiro AAAAMMS já está em ordem cronológica; o eixo usa os rótulos
+        df_semana_numeric.index = df_semana_numeric.index.map(labels_semana)
         
         fig_semana = go.Figure()
         
@@ -962,38 +1615,424 @@ elif st.session_state.current_step == 3:
         
         st.plotly_chart(fig_nutri, use_container_width=True)
         
-        # Download dos resultados
+        # OCUPAÇÃO MÓVEL - janelas de 4 e 12 semanas por somas acumuladas sobre o cubo completo
         st.markdown("---")
-        st.subheader("💾 Exportar Resultados")
+        st.subheader(f"📉 Ocupação Móvel por Nutricionista - {periodo_label}")
         
-        col1, col2, col3 = st.columns(3)
+        if st.session_state.dataset_hash is None:
+            st.session_state.dataset_hash = hash_dataset(
+                st.session_state.processed_disponibilidade,
+                st.session_state.processed_ocupacao
+            )
+        semanas_cubo, nutris_cubo, oferta_cubo, ocupacao_cubo = cubo_semanal(
+            st.session_state.dataset_hash,
+            st.session_state.processed_disponibilidade,
+            st.session_state.processed_ocupacao
+        )
         
-        with col1:
-            csv = df_output.to_csv(index=True).encode('utf-8')
-            st.download_button(
-                label="📥 Download Tabela Completa (CSV)",
-                data=csv,
-                file_name=f"disponibilidade_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
+        # As janelas terminam na semana do último dia do período selecionado (ou dos dados)
+        if periodo_num is not None:
+            ultimo_dia = pd.Timestamp(year=periodo_num // 100, month=periodo_num % 100, day=1) + pd.offsets.MonthEnd(0)
+            fim_movel = int(np.searchsorted(semanas_cubo, np.datetime64(ultimo_dia), side="right")) - 1
+        else:
+            fim_movel = len(semanas_cubo) - 1
+        
+        if fim_movel < 0:
+            st.info("ℹ️ Sem semanas suficientes para calcular a ocupação móvel.")
+        else:
+            cs_oferta = somas_acumuladas(oferta_cubo)
+            cs_ocupacao = somas_acumuladas(ocupacao_cubo)
+            
+            tabela_movel = {"Nutricionista": nutris_cubo}
+            for janela in (4, 12):
+                atual = taxa_movel(cs_oferta, cs_ocupacao, janela, fim_movel)
+                anterior = taxa_movel(cs_oferta, cs_ocupacao, janela, fim_movel - janela)
+                tabela_movel[f"Ocupação {janela} sem (%)"] = atual.round(1)
+                tabela_movel[f"Δ {janela} sem (p.p.)"] = (atual - anterior).round(1)
+            
+            # Série semanal das últimas 12 semanas para o sparkline; semanas sem oferta
+            # (feriados, lacunas) ficam NaN e aparecem como falha na linha, não como 0%
+            ini_serie = max(0, fim_movel - 11)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                serie = np.where(
+                    oferta_cubo[ini_serie:fim_movel + 1] > 0,
+                    ocupacao_cubo[ini_serie:fim_movel + 1] / oferta_cubo[ini_serie:fim_movel + 1] * 100,
+                    np.nan
+                ).round(1)
+            tabela_movel["Últimas 12 semanas"] = list(serie.T)
+            
+            df_movel = pd.DataFrame(tabela_movel).sort_values("Δ 4 sem (p.p.)", na_position="last")
+            st.caption(
+                f"Janelas de semanas completas (segunda a domingo) terminando na semana de "
+                f"{pd.Timestamp(semanas_cubo[fim_movel]):%d/%m/%Y} ({fim_movel + 1} semana(s) de histórico). "
+                f"Δ compara com a janela imediatamente anterior."
+            )
+            st.dataframe(
+                df_movel,
+                use_container_width=True,
+                height=400,
+                hide_index=True,
+                column_config={
+                    "Ocupação 4 sem (%)": st.column_config.NumberColumn(format="%.1f%%"),
+                    "Δ 4 sem (p.p.)": st.column_config.NumberColumn(format="%+.1f"),
+                    "Ocupação 12 sem (%)": st.column_config.NumberColumn(format="%.1f%%"),
+                    "Δ 12 sem (p.p.)": st.column_config.NumberColumn(format="%+.1f"),
+                    "Últimas 12 semanas": st.column_config.LineChartColumn(y_min=0, y_max=100),
+                }
             )
         
-        with col2:
-            csv_semana = df_semana_display.to_csv(index=True).encode('utf-8')
-            st.download_button(
-                label="📥 Download Resumo Semanal (CSV)",
-                data=csv_semana,
-                file_name=f"resumo_semanal_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
+        # DETALHAMENTO POR NUTRICIONISTA - fatia pelas posições pré-calculadas, sem varrer o DataFrame
+        st.markdown("---")
+        st.subheader(f"🔎 Detalhamento por Nutricionista - {periodo_label}")
+        
+        if st.session_state.indices_disponibilidade is None or st.session_state.indices_ocupacao is None:
+            st.session_state.indices_disponibilidade = indexar_por_nutri(st.session_state.processed_disponibilidade)
+            st.session_state.indices_ocupacao = indexar_por_nutri(st.session_state.processed_ocupacao)
+        
+        nutri_detalhe = st.selectbox(
+            "Selecione a nutricionista:",
+            middle_cols_sorted,
+            key="nutri_detalhe"
+        )
+        
+        if nutri_detalhe is not None:
+            df_disp_nutri = fatiar_nutri(
+                st.session_state.processed_disponibilidade,
+                st.session_state.indices_disponibilidade,
+                nutri_detalhe,
+                periodo_num
+            )
+            df_ocup_nutri = fatiar_nutri(
+                st.session_state.processed_ocupacao,
+                st.session_state.indices_ocupacao,
+                nutri_detalhe,
+                periodo_num
+            )
+            
+            # Visão diária
+            df_dia = pd.DataFrame({
+                "Oferta": df_disp_nutri.groupby("Data")["Janelas"].sum(),
+                "Ocupação": df_ocup_nutri.groupby("Data")["CASO"].count()
+            }).fillna(0).astype(int).sort_index()
+            df_dia["% Ocupação"] = (
+                df_dia["Ocupação"] / df_dia["Oferta"]
+            ).replace([np.inf, np.nan], 0) * 100
+            
+            # Visão por dia da semana: agrupa pelo índice do dia (0 = segunda) nos dois
+            # arquivos, como no mapa de calor, e só converte para o nome na exibição
+            dias_semana = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"]
+            df_dds = pd.DataFrame({
+                "Oferta": df_disp_nutri.groupby(df_disp_nutri["Data"].dt.weekday)["Janelas"].sum(),
+                "Ocupação": df_ocup_nutri.groupby(df_ocup_nutri["Data"].dt.weekday)["CASO"].count()
+            }).fillna(0).astype(int).sort_index()
+            df_dds.index = [dias_semana[int(d)] for d in df_dds.index]
+            df_dds["% Ocupação"] = (
+                df_dds["Ocupação"] / df_dds["Oferta"]
+            ).replace([np.inf, np.nan], 0) * 100
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Oferta", f"{formatar_numero(df_dia['Oferta'].sum())} janelas")
+            with col2:
+                st.metric("Ocupação", f"{formatar_numero(df_dia['Ocupação'].sum())} agendas")
+            with col3:
+                oferta_nutri_total = df_dia['Oferta'].sum()
+                taxa_nutri = df_dia['Ocupação'].sum() / oferta_nutri_total * 100 if oferta_nutri_total > 0 else 0
+                st.metric("Taxa de Ocupação", formatar_percentual(taxa_nutri), delta=formatar_percentual(taxa_nutri - 80))
+            
+            fig_dia = go.Figure()
+            fig_dia.add_trace(go.Bar(x=df_dia.index, y=df_dia['Oferta'], name='Oferta', marker_color='#66cbdd'))
+            fig_dia.add_trace(go.Bar(x=df_dia.index, y=df_dia['Ocupação'], name='Ocupação', marker_color='#044851'))
+            fig_dia.update_layout(
+                barmode='group',
+                title=f'Oferta vs Ocupação por Dia - {nutri_detalhe}',
+                xaxis_title='Data',
+                yaxis_title='Quantidade de Janelas',
+                height=400,
+                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
             )
+            st.plotly_chart(fig_dia, use_container_width=True)
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown("**Por dia da semana**")
+                df_dds_display = df_dds.copy()
+                df_dds_display["% Ocupação"] = df_dds_display["% Ocupação"].apply(formatar_percentual)
+                st.dataframe(df_dds_display.rename_axis("Dia"), use_container_width=True)
+            with col2:
+                st.markdown("**Por dia**")
+                df_dia_display = df_dia.copy()
+                df_dia_display.index = df_dia_display.index.strftime("%d/%m/%Y")
+                df_dia_display["% Ocupação"] = df_dia_display["% Ocupação"].apply(formatar_percentual)
+                st.dataframe(df_dia_display.rename_axis("Data"), use_container_width=True)
+            
+            with st.expander("🪟 Ver janelas de atendimento"):
+                df_janelas = df_disp_nutri[["Data", "DDS", "Início", "Fim", "Janelas"]].sort_values(["Data", "Início"])
+                df_janelas["Agendas no dia"] = df_janelas["Data"].map(df_dia["Ocupação"]).fillna(0).astype(int)
+                df_janelas["Data"] = df_janelas["Data"].dt.strftime("%d/%m/%Y")
+                st.dataframe(df_janelas, use_container_width=True, hide_index=True)
         
-        with col3:
-            csv_nutri = df_percent_nutri.to_csv(index=True).encode('utf-8')
-            st.download_button(
-                label="📥 Download Análise Nutricionistas (CSV)",
-                data=csv_nutri,
-                file_name=f"analise_nutri_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
+        # MAPA DE CALOR - dia da semana x hora do dia
+        st.markdown("---")
+        st.subheader(f"🕒 Ocupação por Dia da Semana e Horário - {periodo_label}")
+        
+        nutris_mapa = st.multiselect(
+            "Filtrar nutricionistas (vazio = equipe toda)",
+            middle_cols_sorted,
+            key="nutris_mapa"
+        )
+        
+        if nutris_mapa:
+            pos_disp = np.concatenate([st.session_state.indices_disponibilidade.get(n, np.array([], dtype=np.int64)) for n in nutris_mapa])
+            pos_ocup = np.concatenate([st.session_state.indices_ocupacao.get(n, np.array([], dtype=np.int64)) for n in nutris_mapa])
+            df_disp_mapa = st.session_state.processed_disponibilidade.iloc[np.sort(pos_disp)]
+            df_ocup_mapa = st.session_state.processed_ocupacao.iloc[np.sort(pos_ocup)]
+            if periodo_num is not None:
+                df_disp_mapa = df_disp_mapa[df_disp_mapa['Periodo'] == periodo_num]
+                df_ocup_mapa = df_ocup_mapa[df_ocup_mapa['Periodo'] == periodo_num]
+        else:
+            df_disp_mapa = df_disp
+            df_ocup_mapa = df_ocup
+        
+        oferta_grade = grade_oferta_horaria(
+            df_disp_mapa["Data"].dt.weekday.to_numpy(dtype=float, na_value=np.nan),
+            df_disp_mapa["Hora_inicio"].to_numpy(dtype=float, na_value=np.nan),
+            df_disp_mapa["Janelas"].to_numpy(dtype=float, na_value=np.nan)
+        )
+        ocup_grade = grade_agendas_horaria(
+            df_ocup_mapa["Data"].dt.weekday.to_numpy(dtype=float, na_value=np.nan),
+            df_ocup_mapa["Hora"].to_numpy(dtype=float, na_value=np.nan)
+        )
+        
+        if ocup_grade.sum() == 0 and len(df_ocup_mapa) > 0:
+            st.info("ℹ️ O arquivo de agenda não traz o horário dos agendamentos; o mapa mostra apenas a oferta.")
+        
+        with np.errstate(divide="ignore", invalid="ignore"):
+            taxa_grade = np.where(oferta_grade > 0, ocup_grade / oferta_grade * 100, np.nan)
+        
+        horas_usadas = np.nonzero((oferta_grade + ocup_grade).sum(axis=0))[0]
+        if horas_usadas.size == 0:
+            st.info("ℹ️ Sem janelas no período selecionado.")
+        else:
+            horas = np.arange(horas_usadas.min(), horas_usadas.max() + 1)
+            dias_semana_mapa = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"]
+            fig_mapa = go.Figure(go.Heatmap(
+                x=[f"{h:02d}h" for h in horas],
+                y=dias_semana_mapa,
+                z=taxa_grade[:, horas],
+                customdata=np.dstack([oferta_grade[:, horas], ocup_grade[:, horas]]),
+                colorscale=[[0, '#eb4524'], [0.5, '#fcc105'], [0.8, '#c3d76b'], [1, '#044851']],
+                zmin=0,
+                zmax=100,
+                colorbar=dict(title="% Ocupação"),
+                hovertemplate="%{y} %{x}<br>Ocupação: %{z:.1f}%<br>Oferta: %{customdata[0]} janelas<br>Agendas: %{customdata[1]}<extra></extra>"
+            ))
+            fig_mapa.update_layout(
+                title='Taxa de Ocupação por Dia da Semana x Hora',
+                xaxis_title='Hora do dia',
+                yaxis=dict(autorange='reversed'),
+                height=400
+            )
+            st.plotly_chart(fig_mapa, use_container_width=True)
+        
+        # SUGESTÕES DE AJUSTE - horários a cortar ou abrir para aproximar cada pessoa da meta de 80%
+        st.markdown("---")
+        st.subheader(f"🛠️ Sugestões de Ajuste de Agenda - {periodo_label}")
+        
+        if df_ocup["Hora"].notna().sum() == 0:
+            st.info("ℹ️ O arquivo de agenda não traz o horário dos agendamentos; não é possível sugerir ajustes por horário.")
+        elif len(df_disp) > 0:
+            nutris_ajuste = np.array(middle_cols_sorted)
+            oferta_nutri_grade = grade_oferta_horaria(
+                df_disp["Data"].dt.weekday.to_numpy(dtype=float, na_value=np.nan),
+                df_disp["Hora_inicio"].to_numpy(dtype=float, na_value=np.nan),
+                df_disp["Janelas"].to_numpy(dtype=float, na_value=np.nan),
+                grupo=pd.Categorical(df_disp["Nutri"], categories=nutris_ajuste).codes,
+                n_grupos=len(nutris_ajuste)
+            )
+            agendas_nutri_grade = grade_agendas_horaria(
+                df_ocup["Data"].dt.weekday.to_numpy(dtype=float, na_value=np.nan),
+                df_ocup["Hora"].to_numpy(dtype=float, na_value=np.nan),
+                grupo=pd.Categorical(df_ocup["Nutri"], categories=nutris_ajuste).codes,
+                n_grupos=len(nutris_ajuste)
             )
+            # Semanas de calendário no período (segunda-feira de cada data)
+            n_semanas_ajuste = max(1, inicio_semana(df_disp["Data"]).nunique())
+            st.markdown(f"*Baseado na média de {n_semanas_ajuste} semana(s) do período; cada adição é 1 hora semanal e cada remoção, as horas ofertadas no horário.*")
+            exibir_recomendacoes(nutris_ajuste, oferta_nutri_grade, agendas_nutri_grade, n_semanas_ajuste)
+        
+        # TENDÊNCIA HISTÓRICA - consulta apenas o intervalo escolhido no banco local
+        st.markdown("---")
+        st.subheader("📈 Tendência Histórica")
+        
+        periodos_hist = historico.listar_periodos()
+        if len(periodos_hist) == 0:
+            st.info("ℹ️ Nenhum período gravado no histórico ainda.")
+        else:
+            def formatar_periodo(p):
+                return f"{p[1]:02d}/{p[0]}"
+            
+            col1, col2 = st.columns([2, 3])
+            with col1:
+                if len(periodos_hist) > 1:
+                    inicio_hist, fim_hist = st.select_slider(
+                        "Intervalo de meses",
+                        options=periodos_hist,
+                        value=(periodos_hist[max(0, len(periodos_hist) - 12)], periodos_hist[-1]),
+                        format_func=formatar_periodo,
+                        key="filtro_historico"
+                    )
+                else:
+                    inicio_hist = fim_hist = periodos_hist[0]
+            with col2:
+                nutris_hist = st.multiselect(
+                    "Nutricionistas (vazio = equipe toda)",
+                    historico.listar_nutris(),
+                    key="nutris_historico"
+                )
+            
+            df_hist = historico.consultar_tendencia(inicio_hist, fim_hist, nutris=nutris_hist)
+            df_hist["Mês"] = [formatar_periodo(p) for p in zip(df_hist["ano"], df_hist["mes"])]
+            
+            fig_hist = px.line(
+                df_hist,
+                x="Mês",
+                y="% Ocupação",
+                color="nutri" if nutris_hist else None,
+                markers=True,
+                title="Taxa de Ocupação por Mês"
+            )
+            fig_hist.add_hline(y=80, line_dash="dash", line_color="#fcc105")
+            fig_hist.update_layout(height=400, xaxis=dict(type='category'))
+            st.plotly_chart(fig_hist, use_container_width=True)
+            
+            with st.expander("📋 Ver dados do histórico"):
+                st.dataframe(
+                    df_hist.rename(columns={"nutri": "Nutricionista", "oferta": "Oferta", "ocupacao": "Ocupação"})
+                    .drop(columns=["ano", "mes"]),
+                    use_container_width=True,
+                    hide_index=True
+                )
+        
+        # Download dos resultados
+        st.markdown("---")
+        st.subheader("💾 Exportar Resultados")
+        
+        # Cada arquivo é gerado só quando solicitado e reaproveitado por conjunto de dados/período
+        chave_exportacao = (st.session_state.dataset_hash, periodo_label)
+        tabelas_exportacao = {
+            "disponibilidade": df_output.rename(index=labels_semana).rename_axis("Semana"),
+            "resumo_semanal": df_semana_display,
+            "analise_nutri": df_percent_nutri
+        }
+        
+        preparadas = st.session_state.exportacao_preparada
+        if preparadas is None or preparadas["chave"] != chave_exportacao:
+            preparadas = st.session_state.exportacao_preparada = {"chave": chave_exportacao, "arquivos": set()}
+        
+        st.caption("Arquivos CSV separados por ';' e em UTF-8 com BOM, prontos para o Excel")
+        carimbo = datetime.now().strftime('%Y%m%d_%H%M%S')
+        opcoes_exportacao = [
+            ("disponibilidade", "Tabela Completa (CSV)", "📥"),
+            ("resumo_semanal", "Resumo Semanal (CSV)", "📥"),
+            ("analise_nutri", "Análise Nutricionistas (CSV)", "📥"),
+            ("exportacao", "Tudo (ZIP - Excel)", "🗜️"),
+        ]
+        
+        for col, (nome, descricao, icone) in zip(st.columns(4), opcoes_exportacao):
+            with col:
+                if nome not in preparadas["arquivos"]:
+                    st.button(
+                        f"⚙️ Preparar {descricao}",
+                        key=f"preparar_{nome}",
+                        on_click=preparadas["arquivos"].add,
+                        args=(nome,)
+                    )
+                else:
+                    if nome == "exportacao":
+                        dados = gerar_zip_exportacoes(*chave_exportacao, tabelas_exportacao)
+                        extensao, mime = "zip", "application/zip"
+                    else:
+                        dados = gerar_exportacao(*chave_exportacao, nome, tabelas_exportacao[nome])
+                        extensao, mime = "csv", "text/csv"
+                    st.download_button(
+                        label=f"{icone} Download {descricao}",
+                        data=dados,
+                        file_name=f"{nome}_{carimbo}.{extensao}",
+                        mime=mime,
+                        key=f"download_{nome}",
+                        on_click="ignore"
+                    )
+        
+        # Relatórios individuais: um arquivo por nutricionista, gerados em processos paralelos
+        # e gravados direto num ZIP temporário em disco
+        st.markdown("#### 👥 Relatórios Individuais")
+        formato_relatorio = st.radio(
+            "Formato dos relatórios",
+            ["xlsx", "csv"],
+            format_func={"xlsx": "Excel (.xlsx)", "csv": "CSV (;)"}.get,
+            horizontal=True,
+            key="formato_relatorios"
+        )
+        chave_relatorios = chave_exportacao + (formato_relatorio,)
+        gerado = st.session_state.relatorios_individuais
+        
+        if gerado is None or gerado["chave"] != chave_relatorios:
+            if st.button("📦 Gerar relatórios individuais"):
+                # Relatórios usam as semanas do mês, as mesmas das tabelas acima
+                tarefas = tarefas_relatorios(
+                    *cubo_semanas_mes(
+                        st.session_state.dataset_hash,
+                        st.session_state.processed_disponibilidade,
+                        st.session_state.processed_ocupacao
+                    ),
+                    labels_semana, periodo_label, formato_relatorio
+                )
+                with st.spinner(f"Gerando {len(tarefas)} relatórios..."):
+                    inicio = datetime.now()
+                    with relatorios.novo_zip() as destino:
+                        relatorios.gerar_zip_relatorios(destino, tarefas)
+                if gerado is not None and os.path.exists(gerado["caminho"]):
+                    os.remove(gerado["caminho"])
+                gerado = st.session_state.relatorios_individuais = {
+                    "chave": chave_relatorios,
+                    "caminho": destino.name,
+                    "quantidade": len(tarefas),
+                    "segundos": (datetime.now() - inicio).total_seconds(),
+                    "anexar": True
+                }
+        
+        if gerado is not None and gerado["chave"] == chave_relatorios:
+            st.caption(
+                f"{gerado['quantidade']} relatórios gerados em {gerado['segundos']:.1f} s "
+                f"(disponível por até {relatorios.IDADE_MAXIMA_ZIP // 60} minutos)"
+            )
+            # O ZIP só é lido no rerun em que foi gerado ou pedido; nos demais reruns da
+            # seção fica só o botão, sem reler nem re-hashear o arquivo
+            if not gerado["anexar"]:
+                st.button(
+                    "📎 Preparar download dos relatórios",
+                    on_click=gerado.update,
+                    kwargs={"anexar": True}
+                )
+            else:
+                gerado["anexar"] = False
+                try:
+                    with open(gerado["caminho"], "rb") as arquivo:
+                        dados_zip = arquivo.read()
+                except FileNotFoundError:
+                    # Removido pela limpeza de ZIPs antigos (novo_zip de outra sessão)
+                    dados_zip = st.session_state.relatorios_individuais = None
+                    st.warning("⚠️ Os relatórios expiraram; gere novamente.")
+                if dados_zip is not None:
+                    st.download_button(
+                        label="🗂️ Download Relatórios Individuais (ZIP)",
+                        data=dados_zip,
+                        file_name=f"relatorios_individuais_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                        mime="application/zip",
+                        on_click="ignore",
+                        help="Um arquivo por nutricionista com oferta, agendas, % de ocupação e horas vagas por semana"
+                    )
         
         # Botão para voltar
         st.markdown("---")
@@ -0,0 +1,184 @@
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+
+# Banco local com os agregados diários de cada período processado
+CAMINHO_HISTORICO = os.environ.get("FLUA_HISTORICO_DB", "historico.db")
+
+# Grão diário: cada gravação substitui só o intervalo de datas do upload, então
+# exportações que cortam o mês no meio (15/12 a 14/01) não apagam o resto do mês
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS agregados_diarios (
+    data TEXT NOT NULL,
+    nutri TEXT NOT NULL,
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    semana INTEGER NOT NULL,
+    semana_label TEXT,
+    oferta INTEGER NOT NULL DEFAULT 0,
+    ocupacao INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (data, nutri)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_diarios_periodo
+    ON agregados_diarios (ano, mes, semana);
+
+CREATE INDEX IF NOT EXISTS idx_diarios_nutri
+    ON agregados_diarios (nutri, ano, mes, semana);
+
+-- Incrementada a cada gravação; a API usa o número como ETag
+CREATE TABLE IF NOT EXISTS versao (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    numero INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS periodos (
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    gravado_em TEXT NOT NULL,
+    PRIMARY KEY (ano, mes)
+) WITHOUT ROWID;
+"""
+
+
+def conectar(caminho=None):
+    """Abre o banco de histórico, criando as tabelas se necessário"""
+    conn = sqlite3.connect(caminho or CAMINHO_HISTORICO, timeout=10)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def agregar_dias(df_disp, df_ocup):
+    """Consolida oferta e ocupação por dia e nutricionista"""
+    chaves = ["data", "nutri"]
+
+    def _chaves(df):
+        return pd.DataFrame({
+            "data": df["Data"].dt.normalize(),
+            "nutri": df["Nutri"],
+            "semana": df["Semana_mes"],
+            "semana_label": df["Semana_label"],
+        })
+
+    oferta = (
+        _chaves(df_disp)
+        .assign(oferta=df_disp["Janelas"].to_numpy())
+        .dropna(subset=chaves + ["semana"])
+        .groupby(chaves, sort=False)
+        .agg(semana=("semana", "first"), semana_label=("semana_label", "first"), oferta=("oferta", "sum"))
+    )
+    ocupacao = (
+        _chaves(df_ocup)
+        .assign(ocupacao=df_ocup["CASO"].notna().to_numpy())
+        .dropna(subset=chaves + ["semana"])
+        .groupby(chaves, sort=False)
+        .agg(semana=("semana", "first"), semana_label=("semana_label", "first"), ocupacao=("ocupacao", "sum"))
+    )
+
+    df_dias = oferta.join(ocupacao, how="outer", lsuffix="_disp")
+    for coluna in ["semana", "semana_label"]:
+        df_dias[coluna] = df_dias[f"{coluna}_disp"].fillna(df_dias[coluna])
+    df_dias = df_dias.drop(columns=["semana_disp", "semana_label_disp"]).reset_index()
+    df_dias[["oferta", "ocupacao"]] = df_dias[["oferta", "ocupacao"]].fillna(0).astype(int)
+    df_dias["semana"] = df_dias["semana"].astype(int)
+    df_dias["ano"] = df_dias["data"].dt.year
+    df_dias["mes"] = df_dias["data"].dt.month
+    df_dias["data"] = df_dias["data"].dt.strftime("%Y-%m-%d")
+    return df_dias[["data", "nutri", "ano", "mes", "semana", "semana_label", "oferta", "ocupacao"]]
+
+
+def gravar_agregados(df_dias, caminho=None):
+    """Grava os agregados diários substituindo apenas o intervalo de datas do upload
+
+    Retorna os meses (ano, mês) tocados pela gravação.
+    """
+    if len(df_dias) == 0:
+        return []
+    inicio, fim = df_dias["data"].min(), df_dias["data"].max()
+    periodos = df_dias[["ano", "mes"]].drop_duplicates().sort_values(["ano", "mes"]).itertuples(index=False, name=None)
+    periodos = [(int(a), int(m)) for a, m in periodos]
+    agora = datetime.now().isoformat(timespec="seconds")
+
+    with closing(conectar(caminho)) as conn, conn:
+        conn.execute("DELETE FROM agregados_diarios WHERE data BETWEEN ? AND ?", (inicio, fim))
+        conn.executemany(
+            "INSERT INTO agregados_diarios (data, nutri, ano, mes, semana, semana_label, oferta, ocupacao) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            df_dias.itertuples(index=False, name=None),
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO periodos (ano, mes, gravado_em) VALUES (?, ?, ?)",
+            [(a, m, agora) for a, m in periodos],
+        )
+        conn.execute(
+            "INSERT INTO versao (id, numero) VALUES (1, 1) "
+            "ON CONFLICT (id) DO UPDATE SET numero = numero + 1"
+        )
+    return periodos
+
+
+def versao(caminho=None):
+    """Número da última gravação (0 se o histórico estiver vazio)"""
+    with closing(conectar(caminho)) as conn:
+        linha = conn.execute("SELECT numero FROM versao WHERE id = 1").fetchone()
+    return linha[0] if linha else 0
+
+
+def listar_periodos(caminho=None):
+    """Lista os períodos (ano, mês) já gravados, em ordem cronológica"""
+    with closing(conectar(caminho)) as conn:
+        return conn.execute("SELECT ano, mes FROM periodos ORDER BY ano, mes").fetchall()
+
+
+def listar_nutris(caminho=None):
+    """Lista as nutricionistas presentes no histórico, em ordem alfabética"""
+    with closing(conectar(caminho)) as conn:
+        return [n for (n,) in conn.execute("SELECT DISTINCT nutri FROM agregados_diarios ORDER BY nutri")]
+
+
+def consultar_cubo(periodo=None, caminho=None):
+    """Cubo ano x mês x semana do mês x nutricionista de um mês (ano, mês) ou de todo o histórico"""
+    filtro, params = "", []
+    if periodo is not None:
+        filtro, params = "WHERE ano = ? AND mes = ? ", list(periodo)
+    sql = (
+        "SELECT ano, mes, semana, nutri, MIN(semana_label) AS semana_label, "
+        "SUM(oferta) AS oferta, SUM(ocupacao) AS ocupacao "
+        f"FROM agregados_diarios {filtro}"
+        "GROUP BY ano, mes, semana, nutri ORDER BY ano, mes, semana, nutri"
+    )
+    with closing(conectar(caminho)) as conn:
+        return pd.read_sql_query(sql, conn, params=params)
+
+
+def consultar_tendencia(inicio, fim, nutris=None, por="mes", caminho=None):
+    """Consulta oferta e ocupação entre dois períodos (ano, mês), inclusive
+
+    Agrupa por mês ou semana e, se ``nutris`` for informado, também por
+    nutricionista. A faixa usa as colunas indexadas (ano, mes), de modo que
+    apenas as linhas do intervalo são lidas do banco.
+    """
+    grupos = ["ano", "mes"] if por == "mes" else ["ano", "mes", "semana"]
+    params = [inicio[0], inicio[1], fim[0], fim[1]]
+    filtro_nutri = ""
+    if nutris:
+        grupos = grupos + ["nutri"]
+        filtro_nutri = f" AND nutri IN ({', '.join('?' * len(nutris))})"
+        params += list(nutris)
+
+    colunas = ", ".join(grupos)
+    label = ", MIN(semana_label) AS semana_label" if por != "mes" else ""
+    sql = (
+        f"SELECT {colunas}{label}, SUM(oferta) AS oferta, SUM(ocupacao) AS ocupacao "
+        "FROM agregados_diarios "
+        f"WHERE (ano, mes) BETWEEN (?, ?) AND (?, ?){filtro_nutri} "
+        f"GROUP BY {colunas} ORDER BY {colunas}"
+    )
+    with closing(conectar(caminho)) as conn:
+        df = pd.read_sql_query(sql, conn, params=params)
+
+    df["% Ocupação"] = (df["ocupacao"] / df["oferta"].where(df["oferta"] > 0) * 100).fillna(0).round(1)
+    return df
@@ -0,0 +1,194 @@
+"""Ingestão em segundo plano das exportações deixadas em uma pasta compartilhada
+
+Monitora a pasta (watchdog), espera cada arquivo parar de crescer antes de lê-lo
+(debounce de gravações parciais) e, quando há um arquivo de disponibilidade e um
+de agenda, roda o processamento completo num pool limitado de workers. O
+resultado fica disponível em ``ultimo_resultado`` para as sessões do dashboard.
+
+Ativado pela variável de ambiente FLUA_PASTA_INGESTAO.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+logger = logging.getLogger(__name__)
+
+EXTENSOES = (".csv", ".xlsx", ".xls")
+
+
+def arquivo_valido(caminho):
+    """Ignora arquivos temporários do Excel, ocultos e downloads em andamento"""
+    nome = os.path.basename(caminho)
+    return nome.lower().endswith(EXTENSOES) and not nome.startswith(("~$", "."))
+
+
+def ler_arquivo(caminho):
+    """Lê CSV ou Excel do mesmo jeito que o upload da Seção 1"""
+    if caminho.lower().endswith(".csv"):
+        return pd.read_csv(caminho)
+    return pd.read_excel(caminho)
+
+
+def classificar(df):
+    """Identifica o tipo de exportação pelas colunas"""
+    if "HORA INICIAL" in df.columns:
+        return "disponibilidade"
+    if "RESPONSÁVEL" in df.columns:
+        return "agenda"
+    return None
+
+
+class Ingestor(FileSystemEventHandler):
+    """Observa a pasta e publica o último processamento completo"""
+
+    def __init__(self, pasta, processar, debounce=5.0, max_workers=1, intervalo=1.0):
+        self.pasta = pasta
+        self.processar = processar
+        self.debounce = debounce
+        self.intervalo = intervalo
+        self.ultimo_resultado = None
+        self.ultimo_erro = None
+
+        self._lock = threading.Lock()
+        self._lock_processamento = threading.Lock()
+        self._pendentes = {}
+        self._arquivos = {"disponibilidade": None, "agenda": None}
+        self._ultimo_par = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="flua-ingestor")
+        self._observer = Observer()
+        self._parar = threading.Event()
+
+    # Eventos do watchdog: apenas registram o arquivo; a leitura espera o debounce
+    def on_created(self, event):
+        if not event.is_directory:
+            self._registrar(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._registrar(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._registrar(event.dest_path)
+
+    def _registrar(self, caminho):
+        if arquivo_valido(caminho):
+            with self._lock:
+                self._pendentes[caminho] = (None, time.monotonic())
+
+    def _assinatura(self, caminho):
+        try:
+            info = os.stat(caminho)
+        except OSError:
+            return None
+        return (info.st_size, info.st_mtime_ns)
+
+    def _verificar_pendentes(self):
+        """Envia para processamento os arquivos estáveis há pelo menos ``debounce`` segundos"""
+        while not self._parar.wait(self.intervalo):
+            agora = time.monotonic()
+            prontos = []
+            with self._lock:
+                for caminho, (assinatura, desde) in list(self._pendentes.items()):
+                    atual = self._assinatura(caminho)
+                    if atual is None:
+                        del self._pendentes[caminho]
+                    elif atual != assinatura:
+                        self._pendentes[caminho] = (atual, agora)
+                    elif agora - desde >= self.debounce:
+                        del self._pendentes[caminho]
+                        prontos.append(caminho)
+            for caminho in prontos:
+                self._executor.submit(self._ingerir, caminho)
+
+    def _ingerir(self, caminho):
+        try:
+            df = ler_arquivo(caminho)
+        except Exception as e:
+            # Arquivo ainda incompleto ou corrompido: tenta de novo na próxima modificação
+            logger.warning("Não foi possível ler %s: %s", caminho, e)
+            return
+        tipo = classificar(df)
+        if tipo is None:
+            logger.info("Arquivo ignorado (colunas não reconhecidas): %s", caminho)
+            return
+        with self._lock:
+            self._arquivos[tipo] = (caminho, df)
+        self._processar()
+
+    def _processar(self):
+        with self._lock:
+            disp, agenda = self._arquivos["disponibilidade"], self._arquivos["agenda"]
+        if disp is None or agenda is None:
+            return
+        with self._lock_processamento:
+            par = (id(disp[1]), id(agenda[1]))
+            if par == self._ultimo_par:
+                return
+            try:
+                resultado = self.processar(disp[1], agenda[1])
+            except Exception as e:
+                self.ultimo_erro = f"{datetime.now():%d/%m/%Y %H:%M} - {e}"
+                logger.exception("Falha ao processar %s e %s", disp[0], agenda[0])
+                return
+            resultado["arquivos"] = (os.path.basename(disp[0]), os.path.basename(agenda[0]))
+            resultado["gerado_em"] = datetime.now()
+            self.ultimo_resultado = resultado
+            self.ultimo_erro = None
+            self._ultimo_par = par
+            logger.info("Dados processados a partir de %s e %s", disp[0], agenda[0])
+
+    def _carregar_existentes(self):
+        """Na partida, usa o arquivo mais recente de cada tipo já presente na pasta"""
+        caminhos = [
+            os.path.join(self.pasta, nome) for nome in os.listdir(self.pasta)
+            if arquivo_valido(nome)
+        ]
+        mais_recentes = {}
+        for caminho in sorted(caminhos, key=os.path.getmtime, reverse=True):
+            try:
+                df = ler_arquivo(caminho)
+            except Exception as e:
+                logger.warning("Não foi possível ler %s: %s", caminho, e)
+                continue
+            tipo = classificar(df)
+            if tipo is not None and tipo not in mais_recentes:
+                mais_recentes[tipo] = (caminho, df)
+            if len(mais_recentes) == 2:
+                break
+        with self._lock:
+            self._arquivos.update(mais_recentes)
+        self._processar()
+
+    def iniciar(self):
+        os.makedirs(self.pasta, exist_ok=True)
+        self._observer.schedule(self, self.pasta, recursive=False)
+        self._observer.daemon = True
+        self._observer.start()
+        threading.Thread(target=self._verificar_pendentes, name="flua-ingestor-debounce", daemon=True).start()
+        self._executor.submit(self._carregar_existentes)
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self._observer.stop()
+        self._executor.shutdown(wait=False)
+
+
+def configuracao():
+    """Pasta, debounce e workers definidos nas variáveis de ambiente, ou None se desativado"""
+    pasta = os.environ.get("FLUA_PASTA_INGESTAO")
+    if not pasta:
+        return None
+    return {
+        "pasta": pasta,
+        "debounce": float(os.environ.get("FLUA_INGESTAO_DEBOUNCE", "5")),
+        "max_workers": int(os.environ.get("FLUA_INGESTAO_WORKERS", "1")),
+    }
@@ -0,0 +1,100 @@
+"""Relatórios individuais por nutricionista, gerados em processos paralelos
+
+Cada tarefa recebe só as séries semanais de uma pessoa (pequenas para enviar
+entre processos) e devolve o arquivo pronto; o ZIP é gravado em disco à medida
+que os arquivos chegam, sem manter todos em memória ao mesmo tempo.
+"""
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+CABECALHO = ["Semana", "Oferta", "Ocupação", "% Ocupação", "Horas Vagas"]
+
+# Abaixo disso o custo de subir os processos supera o ganho
+MIN_TAREFAS_PARALELO = 8
+
+# ZIPs gerados ficam num diretório próprio e são apagados depois deste tempo
+DIRETORIO_ZIPS = os.path.join(tempfile.gettempdir(), "flua_relatorios")
+IDADE_MAXIMA_ZIP = 3600
+
+
+def nome_arquivo(nutri, extensao):
+    """Nome de arquivo seguro a partir do nome da nutricionista"""
+    return re.sub(r"[^\w]+", "_", nutri).strip("_") + f".{extensao}"
+
+
+def linhas_relatorio(semanas, oferta, ocupacao):
+    """Linhas semana a semana e total: oferta, ocupação, % ocupação e horas vagas"""
+    linhas = []
+    for semana, of, oc in zip(semanas, oferta, ocupacao):
+        taxa = round(oc / of * 100, 1) if of > 0 else 0.0
+        linhas.append([semana, int(of), int(oc), taxa, int(max(of - oc, 0))])
+    of_total, oc_total = sum(oferta), sum(ocupacao)
+    taxa_total = round(oc_total / of_total * 100, 1) if of_total > 0 else 0.0
+    linhas.append(["TOTAL", int(of_total), int(oc_total), taxa_total, int(max(of_total - oc_total, 0))])
+    return linhas
+
+
+def gerar_relatorio(tarefa):
+    """Gera o arquivo de uma nutricionista; retorna (nome do arquivo, bytes)"""
+    nutri, periodo, semanas, oferta, ocupacao, formato = tarefa
+    linhas = linhas_relatorio(semanas, oferta, ocupacao)
+
+    if formato == "xlsx":
+        from openpyxl import Workbook
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Relatório")
+        ws.append([f"{nutri} - {periodo}"])
+        ws.append(CABECALHO)
+        for linha in linhas:
+            ws.append(linha)
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        return nome_arquivo(nutri, "xlsx"), buffer.getvalue()
+
+    # CSV no padrão do Excel brasileiro (; e UTF-8 com BOM)
+    texto = "\n".join(
+        ";".join(str(c).replace(".", ",") if isinstance(c, float) else str(c) for c in linha)
+        for linha in [CABECALHO] + linhas
+    )
+    return nome_arquivo(nutri, "csv"), ("\ufeff" + texto + "\n").encode("utf-8")
+
+
+def gerar_zip_relatorios(destino, tarefas, max_workers=None):
+    """Gera os relatórios em paralelo e grava cada um no ZIP assim que fica pronto"""
+    if max_workers is None:
+        max_workers = min(os.cpu_count() or 1, 4)
+
+    with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        if len(tarefas) < MIN_TAREFAS_PARALELO or max_workers <= 1:
+            for nome, conteudo in map(gerar_relatorio, tarefas):
+                zf.writestr(nome, conteudo)
+            return len(tarefas)
+
+        # spawn: o processo do Streamlit tem threads (tornado, watchdog), fork não é seguro
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=contexto) as pool:
+            chunksize = max(1, len(tarefas) // (max_workers * 4))
+            for nome, conteudo in pool.map(gerar_relatorio, tarefas, chunksize=chunksize):
+                zf.writestr(nome, conteudo)
+    return len(tarefas)
+
+
+def novo_zip():
+    """Cria um ZIP vazio no diretório dos relatórios, apagando antes os que passaram da idade máxima"""
+    os.makedirs(DIRETORIO_ZIPS, exist_ok=True)
+    limite = time.time() - IDADE_MAXIMA_ZIP
+    for entrada in os.scandir(DIRETORIO_ZIPS):
+        try:
+            if entrada.is_file() and entrada.stat().st_mtime < limite:
+                os.remove(entrada.path)
+        except OSError:
+            # Outra sessão pode ter apagado o arquivo ao mesmo tempo
+            pass
+    return tempfile.NamedTemporaryFile(dir=DIRETORIO_ZIPS, suffix=".zip", delete=False)
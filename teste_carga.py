@@ -0,0 +1,569 @@
+"""Teste de carga local do dashboard com sessões simuladas
+
+Cada sessão percorre o mesmo fluxo de um coordenador: upload -> processamento ->
+resultados -> troca de mês, com arquivos gerados sinteticamente. Ao final é
+gerado um relatório de capacidade com percentis de latência por etapa e
+crescimento de memória (RSS) por sessão.
+
+Modos:
+    servidor (padrão)  sobe um ``streamlit run app.py`` local e conecta sessões
+                       pelo mesmo websocket do navegador, com até --concorrencia
+                       sessões executando reruns ao mesmo tempo no mesmo servidor.
+                       O upload passa pelo file_uploader (PUT do arquivo + estado
+                       do widget) e a memória medida é a do processo do servidor.
+    apptest            streamlit.testing AppTest: cada processo executa suas
+                       sessões uma de cada vez, então mede apenas a latência de
+                       sessão única (sem reruns simultâneos num mesmo servidor) e
+                       os arquivos entram direto no session_state.
+
+Uso:
+    python teste_carga.py --sessoes 20 --concorrencia 4 --nutris 60 --meses 3
+    python teste_carga.py --modo apptest --sessoes 10 --concorrencia 2
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+DIRETORIO_APP = os.path.dirname(os.path.abspath(__file__))
+DIAS_SEMANA = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"]
+
+ESCOPO = {
+    "servidor": "Sessões simultâneas num único servidor streamlit run, via websocket; "
+                "upload pelo file_uploader; RSS do processo do servidor.",
+    "apptest": "Latência de sessão única: cada processo executa suas sessões em sequência "
+               "(sem reruns simultâneos no mesmo servidor) e os arquivos entram direto no "
+               "session_state, sem passar pelo upload.",
+}
+
+
+def gerar_arquivos(n_nutris=60, meses=3, inicio="2025-01-01", seed=0):
+    """Gera arquivos sintéticos de disponibilidade e agenda no formato das exportações"""
+    rng = np.random.default_rng(seed)
+    nomes = np.array([f"Nutricionista{i:03d} Teste Sobrenome{i:03d}" for i in range(n_nutris)])
+    datas = pd.date_range(inicio, periods=meses, freq="MS")
+    datas = pd.date_range(datas[0], datas[-1] + pd.offsets.MonthEnd(0), freq="D")
+
+    # Cerca de 70% das combinações dia x nutricionista têm uma janela
+    dia_idx, nutri_idx = np.nonzero(rng.random((len(datas), n_nutris)) < 0.7)
+    hora_ini = rng.integers(7, 15, size=len(dia_idx))
+    duracao = rng.integers(1, 7, size=len(dia_idx))
+    datas_txt = datas.strftime("%d/%m/%Y").to_numpy()[dia_idx]
+    dds = np.array(DIAS_SEMANA)[datas.weekday.to_numpy()[dia_idx]]
+    data_completa = pd.Series(datas_txt).str.cat(pd.Series(dds), sep=" - ")
+
+    df_disp = pd.DataFrame({
+        "HORA INICIAL": data_completa,
+        "HORA FINAL": pd.Series(hora_ini).map("{:02d}:00:00".format),
+        "HORAS TOTAIS": pd.Series(hora_ini + duracao).map("{:02d}:00:00".format),
+        "Unnamed: 3": None,
+        "Unnamed: 4": None,
+        "Unnamed: 5": None,
+        "Unnamed: 6": nomes[nutri_idx],
+    })
+
+    # Uma agenda por hora de janela, com ~75% de ocupação
+    rep = np.repeat(np.arange(len(dia_idx)), duracao)
+    hora = hora_ini[rep] + (np.arange(len(rep)) - np.repeat(np.cumsum(duracao) - duracao, duracao))
+    ocupada = rng.random(len(rep)) < 0.75
+    rep, hora = rep[ocupada], hora[ocupada]
+    df_ocup = pd.DataFrame({
+        "DATA": data_completa.to_numpy()[rep],
+        "HORA": pd.Series(hora).map("{:02d}:00:00".format),
+        "RESPONSÁVEL": nomes[nutri_idx][rep],
+        "CASO": np.arange(1, len(rep) + 1),
+    })
+    return df_disp, df_ocup
+
+
+def simular_upload(df):
+    """Faz o round-trip em CSV que o upload real faz com pd.read_csv"""
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False)
+    buffer.seek(0)
+    return pd.read_csv(buffer)
+
+
+def rss_mb(pid=None):
+    """Memória residente atual do processo (o próprio, por padrão) em MB"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        if pid is not None:
+            return None
+    # Fallback: pico de RSS (KB no Linux, bytes no macOS)
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+def percentis(valores):
+    """p50/p90/p99/máximo em milissegundos"""
+    arr = np.asarray(valores) * 1000
+    return {
+        "n": int(arr.size),
+        "p50_ms": round(float(np.percentile(arr, 50)), 1),
+        "p90_ms": round(float(np.percentile(arr, 90)), 1),
+        "p99_ms": round(float(np.percentile(arr, 99)), 1),
+        "max_ms": round(float(arr.max()), 1),
+    }
+
+
+def inclinacao_rss(amostras):
+    """Crescimento de RSS por sessão: inclinação da reta RSS x sessões vivas"""
+    if len(amostras) < 2:
+        return None
+    n, rss = np.array(amostras, dtype=float).T
+    return float(np.polyfit(n, rss, 1)[0])
+
+
+def consolidar(modo, parametros, duracao, sessoes_ok, erros, latencias, rss_inicial, rss_final, inclinacoes, extra=None):
+    """Monta o relatório de capacidade a partir das medições de qualquer modo"""
+    por_etapa = {}
+    for etapa, segundos in latencias:
+        por_etapa.setdefault(etapa, []).append(segundos)
+    inclinacoes = [i for i in inclinacoes if i is not None]
+    return {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "modo": modo,
+        "escopo": ESCOPO[modo],
+        "parametros": parametros,
+        "duracao_s": round(duracao, 2),
+        "sessoes_ok": sessoes_ok,
+        "erros": erros[:20],
+        "latencia_geral": percentis([s for _, s in latencias]) if latencias else None,
+        "latencia_por_etapa": {etapa: percentis(v) for etapa, v in por_etapa.items()},
+        "rss_inicial_mb": round(rss_inicial, 1) if rss_inicial is not None else None,
+        "rss_final_mb": round(rss_final, 1) if rss_final is not None else None,
+        "rss_por_sessao_mb": round(float(np.mean(inclinacoes)), 2) if inclinacoes else None,
+        **(extra or {}),
+    }
+
+
+# Modo apptest ----------------------------------------------------------------
+
+def _medir(latencias, etapa, at):
+    """Executa um rerun da sessão e registra sua latência"""
+    t0 = time.perf_counter()
+    at.run()
+    latencias.append((etapa, time.perf_counter() - t0))
+    if len(at.exception) > 0:
+        raise RuntimeError(f"{etapa}: {at.exception[0].value}")
+
+
+def executar_sessao(df_disp, df_ocup, timeout):
+    """Percorre o fluxo completo de um coordenador e devolve a sessão e as latências"""
+    from streamlit.testing.v1 import AppTest
+
+    latencias = []
+    at = AppTest.from_file(os.path.join(DIRETORIO_APP, "app.py"), default_timeout=timeout)
+    _medir(latencias, "render_inicial", at)
+
+    # Sem file_uploader: os DataFrames vão direto para o estado da sessão
+    at.session_state["disponibilidade_data"] = simular_upload(df_disp)
+    at.session_state["ocupacao_data"] = simular_upload(df_ocup)
+    at.session_state["current_step"] = 2
+    _medir(latencias, "secao_2", at)
+
+    [b for b in at.button if "Iniciar Processamento" in b.label][0].click()
+    _medir(latencias, "processamento", at)
+
+    at.session_state["current_step"] = 3
+    _medir(latencias, "resultados", at)
+
+    filtros = [s for s in at.selectbox if s.key == "filtro_mes"]
+    if filtros:
+        for opcao in filtros[0].options[1:] + filtros[0].options[:1]:
+            at.selectbox(key="filtro_mes").set_value(opcao)
+            _medir(latencias, "troca_mes", at)
+    return at, latencias
+
+
+def _preparar_ambiente():
+    """O app roda a partir do próprio diretório e com um histórico isolado"""
+    os.chdir(DIRETORIO_APP)
+    if DIRETORIO_APP not in sys.path:
+        sys.path.insert(0, DIRETORIO_APP)
+    os.environ.setdefault("FLUA_HISTORICO_DB", os.path.join(tempfile.mkdtemp(), "historico_carga.db"))
+
+
+def _worker(sessoes, nutris, meses, timeout):
+    """Executa sessões em sequência num processo, mantendo todas vivas como no servidor"""
+    _preparar_ambiente()
+    df_disp, df_ocup = gerar_arquivos(nutris, meses)
+    rss_inicial = rss_mb()
+    ativas, latencias, amostras_rss, erros = [], [], [], []
+    for _ in range(sessoes):
+        try:
+            at, lat = executar_sessao(df_disp, df_ocup, timeout)
+        except Exception as e:
+            erros.append(str(e))
+            continue
+        ativas.append(at)
+        latencias.extend(lat)
+        amostras_rss.append((len(ativas), rss_mb()))
+    return {
+        "ok": len(ativas),
+        "latencias": latencias,
+        "amostras_rss": amostras_rss,
+        "erros": erros,
+        "rss_inicial": rss_inicial,
+        "linhas": (len(df_disp), len(df_ocup)),
+    }
+
+
+def executar_teste_apptest(sessoes, concorrencia, nutris, meses, timeout):
+    """Sessões AppTest divididas entre processos; mede latência de sessão única
+
+    O AppTest não pode rodar em várias threads do mesmo processo, então cada
+    worker executa sua parte das sessões em sequência e a memória por sessão é
+    medida dentro de cada worker.
+    """
+    divisao = [sessoes // concorrencia + (1 if i < sessoes % concorrencia else 0) for i in range(concorrencia)]
+    divisao = [n for n in divisao if n > 0]
+
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=len(divisao)) as pool:
+        futuros = [pool.submit(_worker, n, nutris, meses, timeout) for n in divisao]
+        resultados = [f.result() for f in futuros]
+    duracao = time.perf_counter() - t0
+
+    rss_pico = [r["amostras_rss"][-1][1] for r in resultados if r["amostras_rss"]]
+    return consolidar(
+        "apptest",
+        {
+            "sessoes": sessoes,
+            "concorrencia": concorrencia,
+            "nutris": nutris,
+            "meses": meses,
+            "linhas_disponibilidade": resultados[0]["linhas"][0],
+            "linhas_ocupacao": resultados[0]["linhas"][1],
+        },
+        duracao,
+        sum(r["ok"] for r in resultados),
+        [e for r in resultados for e in r["erros"]],
+        [lat for r in resultados for lat in r["latencias"]],
+        float(np.mean([r["rss_inicial"] for r in resultados])),
+        float(np.mean(rss_pico)) if rss_pico else None,
+        [inclinacao_rss(r["amostras_rss"]) for r in resultados],
+    )
+
+
+# Modo servidor ---------------------------------------------------------------
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor(porta, timeout=60):
+    """Sobe ``streamlit run app.py`` local, sem XSRF para aceitar o PUT do upload"""
+    env = dict(os.environ)
+    env.setdefault("FLUA_HISTORICO_DB", os.path.join(tempfile.mkdtemp(), "historico_carga.db"))
+    processo = subprocess.Popen(
+        [
+            sys.executable, "-m", "streamlit", "run", os.path.join(DIRETORIO_APP, "app.py"),
+            "--server.headless", "true",
+            "--server.address", "127.0.0.1",
+            "--server.port", str(porta),
+            "--server.enableXsrfProtection", "false",
+            "--server.fileWatcherType", "none",
+            "--browser.gatherUsageStats", "false",
+        ],
+        cwd=DIRETORIO_APP,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"streamlit run terminou com código {processo.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", porta), timeout=1):
+                return processo
+        except OSError:
+            time.sleep(0.2)
+    processo.kill()
+    raise RuntimeError(f"Servidor não respondeu na porta {porta} em {timeout} s")
+
+
+class SessaoWebsocket:
+    """Cliente mínimo do protocolo do navegador: reruns com estados de widgets e uploads"""
+
+    def __init__(self, porta, timeout):
+        self.porta = porta
+        self.timeout = timeout
+        self.session_id = None
+        self.widgets = {}
+        self.estado = {}
+        self._ws = None
+
+    async def conectar(self):
+        from tornado.websocket import websocket_connect
+
+        self._ws = await websocket_connect(
+            f"ws://127.0.0.1:{self.porta}/_stcore/stream",
+            subprotocols=["streamlit"],
+            max_message_size=512 * 1024 * 1024,
+        )
+
+    def fechar(self):
+        if self._ws is not None:
+            self._ws.close()
+
+    async def rerun(self, etapa, gatilho=None):
+        """Envia um rerun com o estado atual dos widgets e espera o script terminar"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        msg = BackMsg()
+        msg.rerun_script.widget_states.widgets.extend(self.estado.values())
+        if gatilho is not None:
+            msg.rerun_script.widget_states.widgets.append(WidgetState(id=gatilho, trigger_value=True))
+        t0 = time.perf_counter()
+        await self._ws.write_message(msg.SerializeToString(), binary=True)
+        await asyncio.wait_for(self._aguardar_fim(etapa), self.timeout)
+        return time.perf_counter() - t0
+
+    async def _aguardar_fim(self, etapa):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        self.widgets = {}
+        while True:
+            bruto = await self._ws.read_message()
+            if bruto is None:
+                raise RuntimeError(f"{etapa}: conexão encerrada pelo servidor")
+            msg = ForwardMsg()
+            msg.ParseFromString(bruto)
+            tipo = msg.WhichOneof("type")
+            if tipo == "new_session":
+                self.session_id = msg.new_session.initialize.session_id
+            elif tipo == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                elemento = msg.delta.new_element
+                nome = elemento.WhichOneof("type")
+                proto = getattr(elemento, nome)
+                if nome == "exception":
+                    raise RuntimeError(f"{etapa}: {proto.message}")
+                widget_id = getattr(proto, "id", None)
+                if isinstance(widget_id, str) and widget_id:
+                    self.widgets[widget_id] = (nome, getattr(proto, "label", ""), proto)
+            elif tipo == "script_finished" and msg.script_finished in (
+                ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_WITH_COMPILE_ERROR
+            ):
+                # FINISHED_EARLY_FOR_RERUN (st.rerun) segue para a próxima execução
+                return
+
+    def widget(self, tipo, texto):
+        """Id do widget pelo tipo e pela chave (sufixo do id) ou trecho do rótulo"""
+        for widget_id, (nome, rotulo, _) in self.widgets.items():
+            if nome == tipo and (widget_id.endswith(f"-{texto}") or texto in rotulo):
+                return widget_id
+        raise RuntimeError(f"Widget não encontrado: {tipo} '{texto}'")
+
+    async def enviar_arquivo(self, chave, nome_arquivo, conteudo):
+        """Envia o arquivo como o navegador (PUT multipart) e registra o estado do file_uploader"""
+        from streamlit.proto.Common_pb2 import FileUploaderState, FileURLs, UploadedFileInfo
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+
+        file_id = str(uuid.uuid4())
+        url = f"/_stcore/upload_file/{self.session_id}/{file_id}"
+        fronteira = uuid.uuid4().hex
+        corpo = (
+            f"--{fronteira}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{nome_arquivo}\"\r\n"
+            "Content-Type: text/csv\r\n\r\n"
+        ).encode() + conteudo + f"\r\n--{fronteira}--\r\n".encode()
+        await AsyncHTTPClient().fetch(HTTPRequest(
+            f"http://127.0.0.1:{self.porta}{url}",
+            method="PUT",
+            body=corpo,
+            headers={"Content-Type": f"multipart/form-data; boundary={fronteira}"},
+            request_timeout=self.timeout,
+        ))
+        widget_id = self.widget("file_uploader", chave)
+        self.estado[widget_id] = WidgetState(
+            id=widget_id,
+            file_uploader_state_value=FileUploaderState(
+                max_file_id=1,
+                uploaded_file_info=[UploadedFileInfo(
+                    id=1, name=nome_arquivo, size=len(conteudo), file_id=file_id,
+                    file_urls=FileURLs(file_id=file_id, upload_url=url, delete_url=url),
+                )],
+            ),
+        )
+
+
+async def executar_sessao_servidor(porta, arquivos, timeout):
+    """Fluxo completo de um coordenador pelo websocket; devolve a sessão aberta e as latências"""
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    sessao = SessaoWebsocket(porta, timeout)
+    await sessao.conectar()
+    latencias = []
+
+    async def medir(etapa, gatilho=None):
+        latencias.append((etapa, await sessao.rerun(etapa, gatilho)))
+
+    try:
+        await medir("render_inicial")
+        await sessao.enviar_arquivo("disp_file", "disponibilidade.csv", arquivos[0])
+        await sessao.enviar_arquivo("ocup_file", "agenda.csv", arquivos[1])
+        await medir("upload")
+        await medir("avancar", sessao.widget("button", "Avançar para Processamento"))
+        await medir("processamento", sessao.widget("button", "Iniciar Processamento"))
+        await medir("resultados", sessao.widget("button", "Seção 3"))
+
+        filtro = sessao.widget("selectbox", "filtro_mes")
+        opcoes = list(sessao.widgets[filtro][2].options)
+        for opcao in opcoes[1:] + opcoes[:1]:
+            sessao.estado[filtro] = WidgetState(id=filtro, string_value=opcao)
+            await medir("troca_mes")
+    except Exception:
+        sessao.fechar()
+        raise
+    return sessao, latencias
+
+
+async def _executar_sessoes(porta, pid, sessoes, concorrencia, arquivos, timeout):
+    """Dispara as sessões com no máximo ``concorrencia`` fluxos em andamento ao mesmo tempo
+
+    As sessões concluídas continuam conectadas, como abas abertas, para que a
+    memória do servidor acumule o estado de todas.
+    """
+    limite = asyncio.Semaphore(concorrencia)
+    ativas, latencias, amostras_rss, erros = [], [], [], []
+    pico = [rss_mb(pid) or 0.0]
+    terminou = asyncio.Event()
+
+    async def amostrar():
+        while not terminou.is_set():
+            pico[0] = max(pico[0], rss_mb(pid) or 0.0)
+            await asyncio.sleep(0.25)
+
+    async def uma_sessao():
+        async with limite:
+            try:
+                sessao, lat = await executar_sessao_servidor(porta, arquivos, timeout)
+            except Exception as e:
+                erros.append(str(e) or type(e).__name__)
+                return
+        ativas.append(sessao)
+        latencias.extend(lat)
+        amostras_rss.append((len(ativas), rss_mb(pid)))
+
+    amostrador = asyncio.ensure_future(amostrar())
+    await asyncio.gather(*(uma_sessao() for _ in range(sessoes)))
+    terminou.set()
+    await amostrador
+    for sessao in ativas:
+        sessao.fechar()
+    return ativas, latencias, amostras_rss, erros, pico[0]
+
+
+def executar_teste_servidor(sessoes, concorrencia, nutris, meses, timeout, porta=None):
+    """Sobe um servidor local e mede sessões simultâneas disputando o mesmo processo"""
+    df_disp, df_ocup = gerar_arquivos(nutris, meses)
+    arquivos = (df_disp.to_csv(index=False).encode(), df_ocup.to_csv(index=False).encode())
+
+    porta = porta or porta_livre()
+    servidor = iniciar_servidor(porta)
+    try:
+        rss_inicial = rss_mb(servidor.pid)
+        t0 = time.perf_counter()
+        ativas, latencias, amostras_rss, erros, rss_pico = asyncio.run(
+            _executar_sessoes(porta, servidor.pid, sessoes, concorrencia, arquivos, timeout)
+        )
+        duracao = time.perf_counter() - t0
+    finally:
+        servidor.terminate()
+        servidor.wait(10)
+
+    return consolidar(
+        "servidor",
+        {
+            "sessoes": sessoes,
+            "concorrencia": concorrencia,
+            "nutris": nutris,
+            "meses": meses,
+            "linhas_disponibilidade": len(df_disp),
+            "linhas_ocupacao": len(df_ocup),
+        },
+        duracao,
+        len(ativas),
+        erros,
+        latencias,
+        rss_inicial,
+        amostras_rss[-1][1] if amostras_rss else None,
+        [inclinacao_rss(amostras_rss)],
+        {"rss_pico_mb": round(rss_pico, 1)},
+    )
+
+
+def imprimir_relatorio(relatorio):
+    """Resumo legível do relatório de capacidade"""
+    p = relatorio["parametros"]
+    print(f"Modo {relatorio['modo']}: {relatorio['escopo']}")
+    print(f"Sessões: {relatorio['sessoes_ok']}/{p['sessoes']} ok | concorrência {p['concorrencia']} | "
+          f"{p['nutris']} nutris, {p['meses']} meses ({p['linhas_disponibilidade']} janelas, "
+          f"{p['linhas_ocupacao']} agendas) | {relatorio['duracao_s']} s")
+    print(f"{'etapa':<15}{'n':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'máx ms':>10}")
+    etapas = dict(relatorio["latencia_por_etapa"])
+    if relatorio["latencia_geral"]:
+        etapas["TOTAL"] = relatorio["latencia_geral"]
+    for etapa, v in etapas.items():
+        print(f"{etapa:<15}{v['n']:>6}{v['p50_ms']:>10}{v['p90_ms']:>10}{v['p99_ms']:>10}{v['max_ms']:>10}")
+    origem = "servidor" if relatorio["modo"] == "servidor" else "worker"
+    pico = f", pico {relatorio['rss_pico_mb']} MB" if "rss_pico_mb" in relatorio else ""
+    print(f"RSS do {origem}: {relatorio['rss_inicial_mb']} MB -> {relatorio['rss_final_mb']} MB{pico} "
+          f"(~{relatorio['rss_por_sessao_mb']} MB por sessão)")
+    for erro in relatorio["erros"]:
+        print(f"ERRO: {erro}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modo", choices=["servidor", "apptest"], default="servidor",
+                        help="servidor: sessões simultâneas num streamlit run local; apptest: latência de sessão única")
+    parser.add_argument("--sessoes", type=int, default=10, help="Total de sessões simuladas")
+    parser.add_argument("--concorrencia", type=int, default=4,
+                        help="Sessões executando ao mesmo tempo (no modo apptest, processos)")
+    parser.add_argument("--nutris", type=int, default=60, help="Nutricionistas nos arquivos gerados")
+    parser.add_argument("--meses", type=int, default=3, help="Meses cobertos pelos arquivos gerados")
+    parser.add_argument("--timeout", type=float, default=120, help="Timeout de cada rerun (s)")
+    parser.add_argument("--porta", type=int, default=None, help="Porta do servidor local (padrão: uma livre)")
+    parser.add_argument("--saida", default="relatorio_carga.json", help="Arquivo JSON do relatório")
+    args = parser.parse_args()
+
+    saida = os.path.abspath(args.saida)
+    _preparar_ambiente()
+    if args.modo == "servidor":
+        relatorio = executar_teste_servidor(
+            args.sessoes, args.concorrencia, args.nutris, args.meses, args.timeout, args.porta
+        )
+    else:
+        relatorio = executar_teste_apptest(args.sessoes, args.concorrencia, args.nutris, args.meses, args.timeout)
+    imprimir_relatorio(relatorio)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print(f"Relatório salvo em {saida}")
+
+
+if __name__ == "__main__":
+    main()